@@ -1,83 +1,269 @@
 #!/usr/bin/python3
 
+import os
 import sys
 import json
+import time
+import hashlib
 import argparse
 import jsonschema
-from fill_refs_schema import fill_refs
+import fill_refs_schema
+from concurrent.futures import ProcessPoolExecutor
+from fill_refs_schema import LocalRefResolver
 
+# Compiled meta validators of a worker, keyed by meta schema
+meta_validators = {}
+meta_data_schemas = {}
+# Reference resolvers of a worker, keyed by schema folder
+resolvers = {}
+# Hashes of schema files, keyed by path
+file_hashes = {}
+# Cached results that were not used for this long are removed
+CACHE_MAX_AGE = 30 * 24 * 3600
 
-def validate_schema(schema_file_name, schema, schema_folder_path):
-    meta_data_schema_uri = schema['$schema']
+
+def meta_data_schema_file_name(meta_data_schema_uri):
     if 'http' in meta_data_schema_uri:
         # Find schema via its URL locally
         meta_data_file_name = meta_data_schema_uri.replace("://", "_")
     elif 'tag' in meta_data_schema_uri:
         # Find schema via its tag locally
-        meta_data_file_name = meta_data_schema_uri.replace("tag:", "tag_")
         meta_data_file_name = meta_data_schema_uri.replace(":", "_")
     else:
-        print('Cannot validate schema because no meta_data schema is' +
-              ' found in the folder where the schema can be found.')
-        sys.exit(1)
-    # Check if the path to the schema exists in the schemas folder
-    meta_data_file_name = meta_data_file_name.replace("/", "_")
-    if not schema_folder_path.endswith("/"):
-        schema_folder_path = schema_folder_path + "/"
-    meta_data_schema_path = schema_folder_path + meta_data_file_name + ".json"
+        return None
+    return meta_data_file_name.replace("/", "_") + ".json"
+
+
+def load_meta_data_schema(meta_data_schema_uri, schema_folder_path):
+    # Returns the meta schema with its references filled in and checks it,
+    # or an error message when it cannot be used
+    meta_data_file_name = meta_data_schema_file_name(meta_data_schema_uri)
+    if meta_data_file_name is None:
+        return None, ('Cannot validate schema because no meta_data schema is' +
+                      ' found in the folder where the schema can be found.')
+    meta_data_schema_path = os.path.join(schema_folder_path, meta_data_file_name)
     try:
         with open(meta_data_schema_path, 'r') as f:
             meta_data_schema = json.load(f)
     except Exception:
-        schema_id = schema.get('$id')
-        if schema_id:
-            print("Could not validate schema agains meta schema because could not find meta schema {}".format(meta_data_file_name) +
-                  " , it should be in the same folder as the schema {}".format(schema_id))
-        else:
-            print("The schema {} does not have an ID field".format(schema_file_name))
-        sys.exit(1)
+        return None, ("Could not validate schema agains meta schema because could not find meta schema {}".format(
+            meta_data_file_name) + " , it should be in the same folder as the schema")
     try:
         # Also fill in references if they occur in the meta data schema
-        meta_data_schema = fill_refs(meta_data_schema, schema_folder_path)
-    except Exception as e:
-        print("Could not fill in references in the meta_data_schema because of {}".format(e))
-        sys.exit(1)
+        meta_data_schema = get_resolver(schema_folder_path).fill(meta_data_schema, meta_data_schema_path)
+    except (Exception, SystemExit) as e:
+        return None, "Could not fill in references in the meta_data_schema because of {}".format(e)
+    try:
+        jsonschema.validators.validator_for(meta_data_schema).check_schema(meta_data_schema)
+    except jsonschema.exceptions.SchemaError as e:
+        return None, "Meta data schema {} is not valid because of {}".format(meta_data_file_name, e)
+    return meta_data_schema, None
+
+
+def get_resolver(schema_folder_path):
+    # Files and references in a folder are only read and resolved once per process
+    if schema_folder_path not in resolvers:
+        resolvers[schema_folder_path] = LocalRefResolver(schema_folder_path)
+    return resolvers[schema_folder_path]
+
+
+def init_worker(worker_meta_data_schemas):
+    meta_data_schemas.update(worker_meta_data_schemas)
+
+
+def get_meta_validator(meta_key):
+    # Every process compiles the validator of a meta schema once
+    if meta_key not in meta_validators:
+        meta_data_schema = meta_data_schemas[meta_key]
+        validator_class = jsonschema.validators.validator_for(meta_data_schema)
+        meta_validators[meta_key] = validator_class(meta_data_schema)
+    return meta_validators[meta_key]
+
+
+def validate_schema(task):
+    # Validates a schema against its meta schema, returns the file name and
+    # an error message or None when the schema is conform its meta schema
+    file_name, schema_folder_path, schema, meta_key, _ = task
+    try:
+        # fill in references in schema
+        schema = get_resolver(schema_folder_path).fill(schema)
+    except (Exception, SystemExit) as e:
+        return file_name, "Could not fill in references in the schema because of {}".format(e)
     # Validate the schema agains the meta data schema
+    error = jsonschema.exceptions.best_match(get_meta_validator(meta_key).iter_errors(schema))
+    if error is not None:
+        return file_name, "Schema is not conform meta data schema because of {}".format(error)
+    return file_name, None
+
+
+def get_file_hash(path):
+    if path not in file_hashes:
+        with open(path, 'rb') as f:
+            file_hashes[path] = hashlib.sha256(f.read()).hexdigest()
+    return file_hashes[path]
+
+
+def json_hash(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def ref_closure(schema, schema_folder_path):
+    # Returns the paths of the schema files that a schema references, directly
+    # or through other schemas
+    resolver = get_resolver(schema_folder_path)
+    paths = set()
+    nodes = [schema]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, dict):
+            ref = node.get('$ref')
+            path = resolver.ref_file_path(ref) if isinstance(ref, str) else None
+            if path is not None and path not in paths:
+                paths.add(path)
+                nodes.append(resolver.load(path))
+            nodes.extend(node.values())
+        elif isinstance(node, list):
+            nodes.extend(node)
+    return paths
+
+
+def cache_key(data, schema, schema_folder_path, meta_data_schema_hash):
+    # The key of a schema file covers the code of the hook, its content, the
+    # meta schema with its references filled in and every schema file it
+    # references, or is None when a referenced schema file cannot be read
     try:
-        jsonschema.validate(schema, meta_data_schema)
-    except Exception as e:
-        print("Schema is not conform meta data schema" +
-              " because of {}".format(e))
-        sys.exit(1)
-    return True
+        closure = sorted((path, get_file_hash(path)) for path in ref_closure(schema, schema_folder_path))
+    except Exception:
+        return None
+    key = {
+        'jsonschema': jsonschema.__version__,
+        'hook': [get_file_hash(os.path.abspath(path)) for path in (__file__, fill_refs_schema.__file__)],
+        'schema': hashlib.sha256(data).hexdigest(),
+        'meta_data_schema': meta_data_schema_hash,
+        'references': closure
+    }
+    return json_hash(key)
+
+
+def read_schemas(file_names, cache_dir=None):
+    # Groups the schemas by meta schema, returns the schemas to validate with
+    # their cache keys and the results of files that need no validation
+    tasks = []
+    results = {}
+    meta_data_schema_errors = {}
+    meta_data_schema_hashes = {}
+    for file_name in file_names:
+        # Get file name of json
+        json_file_name = file_name.split("/")[-1]
+        # Open json that needs to be verified
+        try:
+            with open(file_name, 'rb') as f:
+                data = f.read()
+            json_file = json.loads(data)
+        except Exception as e:
+            results[file_name] = "Exception occured when trying to open json, reason {}".format(e)
+            continue
+        if not isinstance(json_file, dict) or '$schema' not in json_file:
+            results[file_name] = None
+            continue
+        # Get folder where json file is from
+        original_folder = file_name[:-len(json_file_name)]
+        if not original_folder:
+            results[file_name] = "Folder of meta schema cannot be found"
+            continue
+        meta_key = (original_folder, json_file['$schema'])
+        if meta_key not in meta_data_schemas and meta_key not in meta_data_schema_errors:
+            meta_data_schema, error = load_meta_data_schema(json_file['$schema'], original_folder)
+            if error:
+                meta_data_schema_errors[meta_key] = error
+            else:
+                meta_data_schemas[meta_key] = meta_data_schema
+        if meta_key in meta_data_schema_errors:
+            results[file_name] = meta_data_schema_errors[meta_key]
+            continue
+        key = None
+        if cache_dir:
+            if meta_key not in meta_data_schema_hashes:
+                meta_data_schema_hashes[meta_key] = json_hash(meta_data_schemas[meta_key])
+            key = cache_key(data, json_file, original_folder, meta_data_schema_hashes[meta_key])
+            if key and os.path.exists(os.path.join(cache_dir, key)):
+                # The schema and everything it depends on passed before
+                results[file_name] = None
+                touch(os.path.join(cache_dir, key))
+                continue
+        tasks.append((file_name, original_folder, json_file, meta_key, key))
+    return tasks, results
+
+
+def default_cache_dir():
+    # Results are cached per user, outside of the repository that is checked
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'schema-conform-meta-schema')
+
+
+def touch(path):
+    # The modification time of a cached result is the last time it was used
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def store_passed(cache_dir, tasks, results):
+    # Only passing results are cached, failing schemas are validated every run
+    os.makedirs(cache_dir, exist_ok=True)
+    for file_name, _, _, _, key in tasks:
+        if key and results[file_name] is None:
+            open(os.path.join(cache_dir, key), 'w').close()
+
+
+def prune_cache(cache_dir, max_age=CACHE_MAX_AGE):
+    # Removes the cached results that were not used recently, like those of
+    # earlier versions of schemas
+    oldest = time.time() - max_age
+    with os.scandir(cache_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.stat().st_mtime < oldest:
+                os.remove(entry.path)
+
+
+def validate_schemas(file_names, processes, cache_dir=None):
+    tasks, results = read_schemas(file_names, cache_dir)
+    if processes > 1 and len(tasks) > 1:
+        # Every process gets the meta schemas once and validates a share of the files
+        with ProcessPoolExecutor(max_workers=min(processes, len(tasks)), initializer=init_worker,
+                                 initargs=(meta_data_schemas,)) as executor:
+            chunksize = max(1, len(tasks) // (processes * 4))
+            results.update(executor.map(validate_schema, tasks, chunksize=chunksize))
+    else:
+        results.update(map(validate_schema, tasks))
+    if cache_dir:
+        try:
+            store_passed(cache_dir, tasks, results)
+            prune_cache(cache_dir)
+        except OSError as e:
+            print("Could not cache results in {} because of {}".format(cache_dir, e))
+    return results
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument('-jf', '--json-file', required=True)
+    parser.add_argument('-jf', '--json-file', nargs='+', default=[])
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('-c', '--cache-dir', default=default_cache_dir(),
+                        help='directory where passing results are cached, empty to disable caching')
+    parser.add_argument('json_files', nargs='*')
     args = parser.parse_args()
-    file_name = args.json_file
-    # Get file name of json
-    json_file_name = file_name.split("/")[-1]
-    # Open json that needs to be verified
-    try:
-        with open(args.json_file, 'r') as f:
-            json_file = json.load(f)
-    except Exception as e:
-        print("Exception occured when trying to open json, reason {}".format(e))
+    file_names = args.json_file + args.json_files
+    if not file_names:
+        parser.error('no JSON files given')
+    results = validate_schemas(file_names, args.processes, args.cache_dir)
+    failed = 0
+    for file_name in file_names:
+        error = results[file_name]
+        if error:
+            failed += 1
+            print("{}: {}".format(file_name, error))
+    if failed:
+        print("{} of {} schemas are not conform their meta schema".format(failed, len(results)))
         sys.exit(1)
-    if '$schema' in json_file:
-        # Get folder where json file is from
-        original_folder = file_name.replace(json_file_name, '')
-        if original_folder:
-            # fill in references in schema
-            try:
-                json_file = fill_refs(json_file, original_folder)
-            except Exception as e:
-                print("Could not fill in references in the schema because of {}".format(e))
-                sys.exit(1)
-            if validate_schema(json_file_name, json_file, original_folder) is False:
-                sys.exit(1)
-        else:
-            print("Folder of meta schema cannot be found")
-            sys.exit(1)
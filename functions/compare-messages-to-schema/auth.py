@@ -1,3 +1,6 @@
+import datetime
+import threading
+
 import config
 import google.auth
 
@@ -6,9 +9,33 @@ from google.auth import iam
 from google.oauth2 import service_account
 
 TOKEN_URI = 'https://accounts.google.com/o/oauth2/token'  # nosec
+REFRESH_MARGIN = datetime.timedelta(minutes=10)
+
+# Delegated credentials of this instance, kept between invocations
+cached_credentials = {}
+credentials_lock = threading.Lock()
 
 
 def request_auth_token():
+    # The token is refreshed ahead of its expiry, so it does not expire during an invocation
+    with credentials_lock:
+        if 'credentials' not in cached_credentials:
+            cached_credentials['credentials'], cached_credentials['project_id'] = create_credentials()
+
+        creds = cached_credentials['credentials']
+        if needs_refresh(creds):
+            creds.refresh(gcp_requests.Request())
+
+        return creds, cached_credentials['project_id']
+
+
+def needs_refresh(creds):
+    if not creds.token or creds.expiry is None:
+        return True
+    return creds.expiry - REFRESH_MARGIN <= datetime.datetime.utcnow()
+
+
+def create_credentials():
     try:
         credentials, project_id = google.auth.default(scopes=['https://www.googleapis.com/auth/iam'])
 
@@ -0,0 +1,174 @@
+import io
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_END = object()
+
+
+class BlobPipeline(object):
+    def __init__(self, read_blob, concurrency, max_queued_batches):
+        """
+        Initializes a pipeline that reads several blobs at once into a bounded queue
+
+        read_blob is a function returning an iterable of message batches for a blob
+        """
+
+        self.read_blob = read_blob
+        self.concurrency = max(1, concurrency)
+        self.max_queued_batches = max(1, max_queued_batches)
+
+        self._cancelled = set()
+
+    def cancel(self, blob):
+        """
+        Stops reading a blob, its reader marks it as read after its current batch
+        """
+
+        self._cancelled.add(blob.name)
+
+    def iterate(self, blobs, deadline=None):
+        """
+        Yields (blob, messages, error) tuples while the blobs are read concurrently,
+        a tuple without messages and error marks that a blob was read completely
+
+        Readers block when the queue is full, so at most max_queued_batches batches
+        are waiting to be validated at any time
+        """
+
+        batches = queue.Queue(maxsize=self.max_queued_batches)
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(
+            max_workers=min(self.concurrency, len(blobs) or 1)
+        )
+
+        try:
+            for blob in blobs:
+                executor.submit(self._read, blob, batches, stop)
+
+            blobs_left = len(blobs)
+            while blobs_left > 0:
+                if deadline and time.time() >= deadline:
+                    return
+
+                try:
+                    blob, messages, error, done = batches.get(timeout=1)
+                except queue.Empty:
+                    continue
+
+                if done:
+                    blobs_left -= 1
+
+                yield blob, messages, error
+        finally:
+            stop.set()
+            self._drain(batches)
+            executor.shutdown(wait=True)
+
+    def _read(self, blob, batches, stop):
+        """
+        Reads a blob and puts its message batches on the queue until asked to stop
+        """
+
+        if stop.is_set():
+            return
+
+        try:
+            for messages in self.read_blob(blob):
+                if blob.name in self._cancelled:
+                    break
+                if not self._put(batches, stop, (blob, messages, None, False)):
+                    return
+        except Exception as e:
+            self._put(batches, stop, (blob, None, e, False))
+
+        self._put(batches, stop, (blob, None, None, True))
+
+    @staticmethod
+    def _put(batches, stop, item):
+        """
+        Puts an item on the queue, gives up when the pipeline is stopped
+        """
+
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            else:
+                return True
+
+        return False
+
+    @staticmethod
+    def _drain(batches):
+        """
+        Empties the queue so that no reader stays blocked on it
+        """
+
+        while True:
+            try:
+                batches.get_nowait()
+            except queue.Empty:
+                return
+
+
+class DiscardingStream(io.RawIOBase):
+    def __init__(self):
+        """
+        Initializes a stream that counts the bytes written to it and drops them
+
+        Used as the target of a download of which the chunks are consumed from
+        the responses, so downloaded bytes are not kept after they are processed
+        """
+
+        super().__init__()
+        self.bytes_written = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        return len(data)
+
+
+def prefetch(items, max_queued):
+    """
+    Yields the items of an iterable that is read ahead in a separate thread
+
+    At most max_queued items are read ahead, so a download continues while the
+    chunks before it are unzipped. An error of the iterable is raised when its
+    items are consumed, the thread stops when the generator is closed
+    """
+
+    queued_items = queue.Queue(maxsize=max(1, max_queued))
+    stop = threading.Event()
+
+    def read():
+        try:
+            for item in items:
+                if not BlobPipeline._put(queued_items, stop, (item, None)):
+                    return
+        except Exception as e:
+            BlobPipeline._put(queued_items, stop, (_END, e))
+        else:
+            BlobPipeline._put(queued_items, stop, (_END, None))
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+
+    try:
+        while True:
+            item, error = queued_items.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+
+            yield item
+    finally:
+        stop.set()
+        BlobPipeline._drain(queued_items)
+        reader.join()
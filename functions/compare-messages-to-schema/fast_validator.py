@@ -0,0 +1,338 @@
+import logging
+import numbers
+import random
+import re
+
+import jsonschema
+from jsonschema._utils import unbool
+
+SUPPORTED_VALIDATORS = (
+    jsonschema.Draft4Validator,
+    jsonschema.Draft6Validator,
+    jsonschema.Draft7Validator,
+)
+
+TYPE_CHECKS = {
+    "object": "isinstance(i, dict)",
+    "array": "isinstance(i, list)",
+    "string": "isinstance(i, str)",
+    "boolean": "isinstance(i, bool)",
+    "null": "i is None",
+    "number": "_is_number(i)",
+    "integer": "_is_integer(i)",
+}
+
+
+class UnsupportedSchema(Exception):
+    pass
+
+
+class FastValidator(object):
+    def __init__(self, validator, is_valid, verify_rate=0.0):
+        """
+        Initializes a validator that checks messages with generated code first
+
+        Only messages that the generated code rejects are validated by the
+        jsonschema validator, which gives the detailed errors. A fraction of
+        verify_rate of the accepted messages is validated by jsonschema as well
+        to verify the generated code, its result is used when they disagree
+        """
+
+        self.validator = validator
+        self.schema = validator.schema
+        self.verify_rate = verify_rate
+
+        self._is_valid = is_valid
+
+    def is_valid(self, instance):
+        """
+        Returns whether an instance is valid, only running the generated code
+        unless the instance is picked to be verified
+        """
+
+        if not self._is_valid(instance):
+            return False
+
+        if not self.verify_rate or random.random() >= self.verify_rate:
+            return True
+
+        if not self.validator.is_valid(instance):
+            logging.error("Generated validator accepted a message that is not valid")
+            return False
+
+        return True
+
+    def iter_errors(self, instance):
+        """
+        Yields the errors of an instance that is_valid rejected, given by the
+        jsonschema validator
+
+        The generated code is not run again, so a message that was rejected when
+        it was verified always gets its errors
+        """
+
+        valid = True
+        for error in self.validator.iter_errors(instance):
+            valid = False
+            yield error
+
+        if valid:
+            logging.warning("Generated validator rejected a message that is valid")
+
+
+def compile_validator(validator, name="schema"):
+    """
+    Returns a function that tells whether an instance is valid against the
+    schema of a jsonschema validator, using Python code generated for the schema
+
+    Returns None when the schema uses keywords that are not supported, so the
+    jsonschema validator is used on its own
+    """
+
+    if type(validator) not in SUPPORTED_VALIDATORS:
+        logging.info(f"No generated validator for schema '{name}': draft not supported")
+        return None
+
+    generator = CodeGenerator(validator)
+    try:
+        entry = generator.function(validator.schema)
+    except (UnsupportedSchema, jsonschema.exceptions.RefResolutionError) as e:
+        logging.info(f"No generated validator for schema '{name}': {e}")
+        return None
+
+    namespace = {
+        "_enum": is_in_enum,
+        "_is_number": is_number,
+        "_is_integer": is_integer if generator.integer_floats else is_int,
+        "_true": lambda i: True,
+        "_false": lambda i: False,
+    }
+    namespace.update(generator.constants)
+    exec(compile(generator.source(), f"<validator {name}>", "exec"), namespace)
+
+    return namespace[entry]
+
+
+class CodeGenerator(object):
+    def __init__(self, validator):
+        """
+        Initializes a generator of a function per (sub)schema of a validator
+
+        References are resolved while generating, with the same resolution
+        scopes as the jsonschema validator would use while validating
+        """
+
+        self.validators = type(validator).VALIDATORS
+        self.id_of = type(validator).ID_OF
+        self.resolver = validator.resolver
+        self.format_checker = validator.format_checker
+        self.integer_floats = validator.is_type(1.0, "integer")
+
+        self.constants = {}
+        self.functions = {}
+        self.lines = []
+
+        self._schemas = []
+
+    def source(self):
+        return "\n".join(self.lines) + "\n"
+
+    def constant(self, value):
+        name = f"c{len(self.constants)}"
+        self.constants[name] = value
+        return name
+
+    def function(self, schema):
+        """
+        Returns the name of the function that validates against a schema
+        """
+
+        if schema is True:
+            return "_true"
+        if schema is False:
+            return "_false"
+        if not isinstance(schema, dict):
+            raise UnsupportedSchema(f"schema {schema!r} is not an object")
+
+        scope = self.id_of(schema)
+        if scope:
+            self.resolver.push_scope(scope)
+
+        try:
+            key = (id(schema), self.resolver.resolution_scope)
+            if key in self.functions:
+                return self.functions[key]
+
+            name = f"v{len(self.functions)}"
+            self.functions[key] = name
+            # Keep the schema, so its id is not reused by another schema
+            self._schemas.append(schema)
+
+            body = self.body(schema)
+        finally:
+            if scope:
+                self.resolver.pop_scope()
+
+        self.lines.append(f"def {name}(i):")
+        self.lines.extend(f"    {line}" for line in body)
+        self.lines.append("    return True")
+
+        return name
+
+    def body(self, schema):
+        ref = schema.get("$ref")
+        if ref is not None:
+            # Up to draft 7 the keywords next to a $ref are ignored
+            url, resolved = self.resolver.resolve(ref)
+            self.resolver.push_scope(url)
+            try:
+                return [f"return {self.function(resolved)}(i)"]
+            finally:
+                self.resolver.pop_scope()
+
+        lines = []
+        for keyword, value in schema.items():
+            if keyword not in self.validators:
+                continue
+
+            generate = getattr(self, f"keyword_{keyword}", None)
+            if generate is None:
+                raise UnsupportedSchema(f"keyword '{keyword}' is not supported")
+
+            lines.extend(generate(value, schema))
+
+        return lines
+
+    def keyword_type(self, types, schema):
+        types = [types] if isinstance(types, str) else types
+        if any(t not in TYPE_CHECKS for t in types):
+            raise UnsupportedSchema(f"type {types!r} is not supported")
+
+        return [f"if not ({' or '.join(TYPE_CHECKS[t] for t in types)}): return False"]
+
+    def keyword_enum(self, enums, schema):
+        return [f"if not _enum(i, {self.constant(enums)}): return False"]
+
+    def keyword_pattern(self, pattern, schema):
+        regex = self.constant(re.compile(pattern))
+        return [f"if isinstance(i, str) and not {regex}.search(i): return False"]
+
+    def keyword_format(self, format_name, schema):
+        if self.format_checker is not None:
+            raise UnsupportedSchema("formats are checked")
+        return []
+
+    def keyword_required(self, required, schema):
+        return [
+            "if isinstance(i, dict):",
+            f"    for k in {self.constant(required)}:",
+            "        if k not in i: return False",
+        ]
+
+    def keyword_properties(self, properties, schema):
+        if not properties:
+            return []
+
+        lines = ["if isinstance(i, dict):"]
+        for key, subschema in properties.items():
+            lines.append(
+                f"    if {key!r} in i and not {self.function(subschema)}(i[{key!r}]):"
+                " return False"
+            )
+        return lines
+
+    def keyword_patternProperties(self, pattern_properties, schema):
+        if not pattern_properties:
+            return []
+
+        lines = ["if isinstance(i, dict):"]
+        for pattern, subschema in pattern_properties.items():
+            regex = self.constant(re.compile(pattern))
+            lines.extend(
+                [
+                    "    for k, x in i.items():",
+                    f"        if {regex}.search(k) and not {self.function(subschema)}(x):"
+                    " return False",
+                ]
+            )
+        return lines
+
+    def keyword_additionalProperties(self, additional_properties, schema):
+        if additional_properties is True:
+            return []
+
+        properties = self.constant(set(schema.get("properties", {})))
+        conditions = [f"k not in {properties}"]
+
+        patterns = "|".join(schema.get("patternProperties", {}))
+        if patterns:
+            conditions.append(f"not {self.constant(re.compile(patterns))}.search(k)")
+
+        if additional_properties is not False:
+            conditions.append(f"not {self.function(additional_properties)}(i[k])")
+
+        lines = [
+            "if isinstance(i, dict):",
+            "    for k in i:",
+            f"        if {' and '.join(conditions)}: return False",
+        ]
+
+        return lines
+
+    def keyword_items(self, items, schema):
+        if isinstance(items, list):
+            if not items:
+                return []
+
+            lines = ["if isinstance(i, list):"]
+            for index, subschema in enumerate(items):
+                lines.append(
+                    f"    if len(i) > {index} and not {self.function(subschema)}(i[{index}]):"
+                    " return False"
+                )
+            return lines
+
+        return [
+            "if isinstance(i, list):",
+            "    for x in i:",
+            f"        if not {self.function(items)}(x): return False",
+        ]
+
+    def keyword_allOf(self, subschemas, schema):
+        return [
+            f"if not {self.function(subschema)}(i): return False"
+            for subschema in subschemas
+        ]
+
+    def keyword_anyOf(self, subschemas, schema):
+        checks = " or ".join(f"{self.function(s)}(i)" for s in subschemas)
+        return [f"if not ({checks}): return False"]
+
+    def keyword_oneOf(self, subschemas, schema):
+        checks = ", ".join(f"{self.function(s)}(i)" for s in subschemas)
+        return [f"if [{checks}].count(True) != 1: return False"]
+
+    def keyword_not(self, subschema, schema):
+        return [f"if {self.function(subschema)}(i): return False"]
+
+
+def is_in_enum(instance, enums):
+    # The same comparison as jsonschema, which does not take True for 1
+    if instance == 0 or instance == 1:
+        unbooled = unbool(instance)
+        return any(unbooled == unbool(each) for each in enums)
+    return instance in enums
+
+
+def is_number(instance):
+    return isinstance(instance, numbers.Number) and not isinstance(instance, bool)
+
+
+def is_int(instance):
+    return isinstance(instance, int) and not isinstance(instance, bool)
+
+
+def is_integer(instance):
+    if isinstance(instance, float):
+        return instance.is_integer()
+    return is_int(instance)
@@ -0,0 +1,178 @@
+import hashlib
+import json
+
+MAX_EXAMPLES = 5
+
+
+class FindingAggregator(object):
+    def __init__(self, max_examples=MAX_EXAMPLES):
+        """
+        Initializes an aggregator that groups findings by a stable fingerprint
+
+        A finding is identified by its type, topic, schema tag, the path in the
+        message, the path in the schema and the validator keyword. Every finding
+        keeps a count, the first and last blob it was seen in and a few examples
+        """
+
+        self.max_examples = max_examples
+
+        self._findings = {}
+
+    def __len__(self):
+        return len(self._findings)
+
+    def add_message_error(
+        self,
+        topic_name,
+        schema_tag,
+        history_bucket,
+        blob_name,
+        e,
+        errors=None,
+        errors_truncated=False,
+    ):
+        """
+        Adds a validation error of a message
+
+        The finding is grouped by the given error, the best match of the errors
+        of the message. All errors of the message are described with it, up to
+        a cap after which errors_truncated is set
+        """
+
+        self._add(
+            finding_type="message",
+            topic_name=topic_name,
+            schema_tag=schema_tag,
+            history_bucket=history_bucket,
+            blob_name=blob_name,
+            key=(list(e.absolute_path), list(e.absolute_schema_path), e.validator),
+            describe=lambda: describe_message_errors(e, errors, errors_truncated),
+        )
+
+    def add_schema_error(self, topic_name, schema_tag, history_bucket, e):
+        """
+        Adds an error of a schema that does not conform its meta schema
+        """
+
+        self._add(
+            finding_type="schema",
+            topic_name=topic_name,
+            schema_tag=schema_tag,
+            history_bucket=history_bucket,
+            blob_name=None,
+            key=(None, list(e.schema_path), e.validator),
+            describe=lambda: describe_error(e, e.schema_path),
+        )
+
+    def add_blob_error(self, topic_name, schema_tag, history_bucket, blob_name, error):
+        """
+        Adds an error of a blob that could not be read
+        """
+
+        self._add(
+            finding_type="blob",
+            topic_name=topic_name,
+            schema_tag=schema_tag,
+            history_bucket=history_bucket,
+            blob_name=blob_name,
+            key=(None, None, error),
+            describe=lambda: {"message": error},
+        )
+
+    def merge(self, other):
+        """
+        Adds the findings of another aggregator, for example one of another process
+        """
+
+        for fingerprint, other_finding in other._findings.items():
+            finding = self._findings.get(fingerprint)
+            if finding is None:
+                self._findings[fingerprint] = dict(
+                    other_finding, examples=list(other_finding["examples"])
+                )
+                continue
+
+            finding["count"] += other_finding["count"]
+            finding["last_blob"] = other_finding["last_blob"]
+            finding["examples"].extend(
+                other_finding["examples"][
+                    : max(0, self.max_examples - len(finding["examples"]))
+                ]
+            )
+
+    def findings(self):
+        """
+        Returns the findings in the order they were first seen
+        """
+
+        return list(self._findings.values())
+
+    def _add(
+        self,
+        finding_type,
+        topic_name,
+        schema_tag,
+        history_bucket,
+        blob_name,
+        key,
+        describe,
+    ):
+        fingerprint = (finding_type, topic_name, schema_tag) + tuple(
+            json.dumps(part, default=str) for part in key
+        )
+
+        finding = self._findings.get(fingerprint)
+        if finding is None:
+            finding = {
+                "fingerprint": hashlib.sha256(
+                    json.dumps(fingerprint).encode("utf-8")
+                ).hexdigest(),
+                "type": finding_type,
+                "topic_name": topic_name,
+                "schema_tag": schema_tag,
+                "history_bucket": history_bucket,
+                "error": describe(),
+                "count": 0,
+                "first_blob": blob_name,
+                "last_blob": blob_name,
+                "examples": [],
+            }
+            self._findings[fingerprint] = finding
+
+        finding["count"] += 1
+        finding["last_blob"] = blob_name
+
+        # Errors are only described for the examples that are kept
+        if len(finding["examples"]) < self.max_examples:
+            example = describe() if finding["examples"] else finding["error"]
+            finding["examples"].append(dict(example, blob_name=blob_name))
+
+
+def describe_message_errors(e, errors=None, errors_truncated=False):
+    """
+    Returns the description of an error together with all errors of its message
+    """
+
+    return dict(
+        describe_error(e, e.absolute_schema_path),
+        errors=[
+            describe_error(error, error.absolute_schema_path)
+            for error in (errors or [e])
+        ],
+        errors_truncated=errors_truncated,
+    )
+
+
+def describe_error(e, schema_path):
+    """
+    Returns the parts of a validation error that are reported as plain data
+    """
+
+    instance = f"{e.instance}"
+
+    return {
+        "message": e.message.replace(f"{instance} ", ""),
+        "absolute_path": f"{list(e.absolute_path)}",
+        "schema_path": f"{list(schema_path)}",
+        "validator": f"{e.validator} '{e.validator_value}'",
+    }
@@ -0,0 +1,161 @@
+import json
+import logging
+import re
+import threading
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SEPARATORS = re.compile(rb"[\s,]*")
+TEXT_SEPARATORS = re.compile(r"[\s,]*")
+MAX_BATCH_ATTEMPTS = 4
+
+
+class StdlibDecoder(object):
+    name = "json"
+
+    def __init__(self):
+        """
+        Initializes a decoder of the messages in a JSON array that uses the
+        json module of the standard library
+
+        The decoder counts the bytes it decoded and the time it took, so the
+        throughput of the decoders can be compared
+        """
+
+        self.bytes_decoded = 0
+        self.seconds = 0.0
+
+        self._decoder = json.JSONDecoder()
+        self._lock = threading.Lock()
+
+    def decode_items(self, buffer, pos):
+        """
+        Decodes the complete objects of a JSON array in a buffer from a position
+
+        Returns the objects, the position after them, whether the end of the
+        array was reached and the error that stopped decoding, if any. An error
+        means that the next object is incomplete or malformed
+        """
+
+        start_time = time.perf_counter()
+        objects, end, finished, error = self._decode_items(buffer, pos)
+
+        with self._lock:
+            self.bytes_decoded += end - pos
+            self.seconds += time.perf_counter() - start_time
+
+        return objects, end, finished, error
+
+    def _decode_items(self, buffer, pos):
+        text = decode_text(buffer[pos:])
+        text_pos = 0
+        objects = []
+        finished = False
+        error = None
+
+        while True:
+            text_pos = TEXT_SEPARATORS.match(text, text_pos).end()
+            if text_pos == len(text):
+                break
+
+            if text[text_pos] == "]":
+                finished = True
+                break
+
+            if text[text_pos] != "{":
+                raise ValueError(
+                    f"Unexpected character '{text[text_pos]}' between messages"
+                )
+
+            try:
+                obj, text_pos_end = self._decoder.raw_decode(text, text_pos)
+            except json.JSONDecodeError as e:
+                error = e
+                break
+
+            objects.append(obj)
+            text_pos = text_pos_end
+
+        if text.isascii():
+            return objects, pos + text_pos, finished, error
+
+        return objects, pos + len(text[:text_pos].encode("utf-8")), finished, error
+
+
+class OrjsonDecoder(StdlibDecoder):
+    name = "orjson"
+
+    def _decode_items(self, buffer, pos):
+        """
+        Decodes the complete objects in the buffer with a single orjson call
+
+        The objects up to the last closing brace are decoded as one array,
+        which only succeeds when that brace ends an object of the array. When
+        that fails for the last few braces, or the array holds anything other
+        than objects, the standard library decodes the buffer, so the results
+        are the same as those of the standard library
+        """
+
+        pos = SEPARATORS.match(buffer, pos).end()
+        if buffer[pos : pos + 1] != b"{":
+            return super()._decode_items(buffer, pos)
+
+        end = len(buffer)
+        for _ in range(MAX_BATCH_ATTEMPTS):
+            end = buffer.rfind(b"}", pos, end)
+            if end < 0:
+                break
+
+            try:
+                objects = orjson.loads(b"[" + buffer[pos : end + 1] + b"]")
+            except orjson.JSONDecodeError:
+                continue
+
+            if not all(isinstance(obj, dict) for obj in objects):
+                break
+
+            # The rest holds the end of the array or an incomplete object
+            more_objects, end, finished, error = super()._decode_items(buffer, end + 1)
+            return objects + more_objects, end, finished, error
+
+        return super()._decode_items(buffer, pos)
+
+
+DECODERS = {
+    StdlibDecoder.name: StdlibDecoder,
+    OrjsonDecoder.name: OrjsonDecoder,
+}
+
+
+def create_decoder(name):
+    """
+    Returns a new decoder of the given backend, the standard library decoder
+    when the backend is unknown or not installed
+    """
+
+    if name == OrjsonDecoder.name and orjson is None:
+        logging.warning("JSON decoder 'orjson' is not installed, using 'json'")
+        return StdlibDecoder()
+
+    if name not in DECODERS:
+        logging.warning(f"Unknown JSON decoder '{name}', using 'json'")
+        return StdlibDecoder()
+
+    return DECODERS[name]()
+
+
+def decode_text(data):
+    """
+    Decodes UTF-8 bytes, leaving out a character that is cut off at the end
+    """
+
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        if e.end == len(data) and e.reason == "unexpected end of data":
+            return data[: e.start].decode("utf-8")
+        raise
@@ -0,0 +1,81 @@
+import re
+
+from json_decoders import StdlibDecoder
+
+ARRAY_START = re.compile(rb"\[\s*\{")
+
+
+class JSONArrayStream(object):
+    def __init__(
+        self, max_pending_size=52428800, offset=0, in_array=False, decoder=None
+    ):
+        """
+        Initializes an incremental splitter of a streamed JSON array of objects
+
+        A stream that is resumed at an offset between two objects of the array is
+        started with in_array set. The objects are decoded from the bytes of the
+        stream by the given decoder, the standard library decoder by default
+        """
+
+        self.max_pending_size = max_pending_size
+
+        self._decoder = decoder or StdlibDecoder()
+        self._buffer = b""
+        self._bytes_fed = offset
+        self._started = in_array
+        self._finished = False
+
+    @property
+    def offset(self):
+        """
+        Returns the byte offset right after the last object that was returned
+        """
+
+        if not self._started:
+            return 0
+
+        return self._bytes_fed - len(self._buffer)
+
+    def feed(self, data):
+        """
+        Feeds the next bytes of the stream and returns the objects completed by them
+        """
+
+        self._bytes_fed += len(data)
+        if self._finished:
+            return []
+
+        buffer = self._buffer + data if self._buffer else bytes(data)
+        pos = 0
+
+        if not self._started:
+            match = ARRAY_START.search(buffer)
+            if not match:
+                # Only keep what can still become the start of the array
+                array_start = buffer.rfind(b"[")
+                self._buffer = buffer[array_start:] if array_start >= 0 else b""
+                return []
+
+            pos = match.end() - 1
+            self._started = True
+
+        objects, pos, finished, error = self._decoder.decode_items(buffer, pos)
+
+        if finished:
+            self._finished = True
+            pos = len(buffer)
+        elif error is not None and len(buffer) - pos > self.max_pending_size:
+            # The object is either incomplete or malformed, wait for more data
+            # unless it is already larger than a message can reasonably be
+            raise ValueError(f"Could not parse message: {error}")
+
+        self._buffer = buffer[pos:]
+        return objects
+
+    def close(self):
+        """
+        Checks that the stream did not end in the middle of a message
+        """
+
+        if self._started and not self._finished and self._buffer.strip():
+            raise ValueError("Stream ended with an incomplete message")
@@ -2,24 +2,81 @@ import io
 import json
 import logging
 import lzma
+import multiprocessing
 import os
-import re
+import queue
+import resource
+import threading
 import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from contextlib import closing
 from datetime import datetime, timedelta
+from itertools import chain, islice
+from urllib.parse import quote
 
 import auth
 import config
-import google.auth.transport.requests as tr_requests
+import json_decoders
 import jsonschema
+import sampling
+import schema_registry
 import tickets
-from fill_refs_schema import fill_refs
+import topic_index
+import xz_index
+from blob_pipeline import BlobPipeline, DiscardingStream, prefetch
+from fill_refs_schema import fill_refs, prefetch_schemas
+from findings import FindingAggregator
 from gobits import Gobits
-from google.cloud import pubsub_v1, storage
-from google.resumable_media.requests import ChunkedDownload
+from google.cloud import pubsub_v1
+from google.cloud.storage import Blob
+from google.resumable_media.requests import ChunkedDownload, Download
+from json_stream import JSONArrayStream
+from sampling import MessageSampler
+from schema_cache import SchemaCache
+from scheduler import TopicScheduler
+from state import StateStore
+from transport import SharedTransport
+from validator_registry import ValidatorRegistry
 
 logging.basicConfig(level=logging.INFO)
 logging.getLogger("google.resumable_media._helpers").setLevel(level=logging.ERROR)
 
+MAX_CHECKPOINT_AGE = 7 * 24 * 3600
+RESERVED_TIME = 30  # Seconds kept after validating to publish issues
+WORKER_GRACE_TIME = 5  # Seconds a worker may take past the deadline to report
+BUNDLE_PREFIX = "_bundled/"
+PUBLISH_BATCH_SETTINGS = pubsub_v1.types.BatchSettings(
+    max_messages=100, max_bytes=1024 * 1024, max_latency=0.05
+)
+PUBLISH_TIMEOUT = 60
+JSON_DECODER = os.environ.get("JSON_DECODER", "json")
+MAX_MESSAGE_ERRORS = int(os.environ.get("MAX_MESSAGE_ERRORS", 20))
+QUEUED_DOWNLOADS = 2
+QUEUED_PARTS = 8  # Unzipped parts that a block read keeps ahead of the parser
+CHUNK_SIZE = 256000  # 250KB
+MEDIA_URL = "https://storage.googleapis.com/download/storage/v1/b/{bucket}/o/{name}?generation={generation}&alt=media"
+
+validator_registry = ValidatorRegistry(
+    engine=os.environ.get("VALIDATOR_ENGINE", "jsonschema"),
+    verify_rate=float(os.environ.get("VALIDATOR_VERIFY_RATE", 0)),
+)
+shared_transport = SharedTransport()
+schema_cache = SchemaCache(
+    cache_dir=os.environ.get("SCHEMA_CACHE_DIR", "/tmp/schema-cache"),
+    max_age=int(os.environ.get("SCHEMA_CACHE_MAX_AGE", 3600)),
+)
+topic_worker = {}
+worker_pool = {}
+catalog_cache = {}
+publisher = None
+
 
 class MessageValidator(object):
     def __init__(
@@ -27,175 +84,456 @@ class MessageValidator(object):
         credentials_ext,
         topic_name,
         messages_bucket_name,
-        schema,
+        validator,
         schema_tag,
         max_process_time,
         process_start_time,
+        schema_hash=None,
+        checkpoints=None,
+        sample_rate=None,
+        decompress_workers=1,
     ):
         """
         Initializes a class for validating messages
+
+        Blobs that have a checkpoint for the same generation and schema hash are
+        resumed where an earlier run stopped. With a sample rate below 1 only
+        that fraction of the messages of every blob is validated. Blobs with
+        several XZ blocks are unzipped by up to decompress_workers threads
         """
 
         self.credentials = credentials_ext
 
         self.topic_name = topic_name
         self.messages_bucket_name = messages_bucket_name
-        self.schema = schema
+        self.validator = validator
         self.schema_tag = schema_tag
+        self.schema_hash = schema_hash
 
         self.max_process_time = max_process_time
         self.process_start_time = process_start_time
+        self.decompress_workers = max(1, decompress_workers)
+
+        self.transport = shared_transport.session(self.credentials)
+
+        self.blobs_validated = set()
+        self.blobs_skipped = []
+        self.messages_read = 0
+        self.messages_validated = 0
+        self.messages_invalid = 0
+        self.bytes_read = 0
+        self._bytes_read_lock = threading.Lock()
+
+        self.findings = FindingAggregator()
+        self.decoder = json_decoders.create_decoder(JSON_DECODER)
 
-        self.transport = tr_requests.AuthorizedSession(self.credentials)
+        self.sampler = (
+            MessageSampler(sample_rate) if sample_rate and sample_rate < 1 else None
+        )
+
+        self.checkpoints = {
+            blob_name: checkpoint
+            for blob_name, checkpoint in (checkpoints or {}).items()
+            if checkpoint.get("schema_hash") == schema_hash
+        }
 
     def validate(self, blob):
         """
         Validates messages from a blob against a schema
         """
 
-        if blob.content_type != "application/x-xz":
-            return
+        return self.validate_blobs([blob])
 
-        messages_not_conform_schema = []
+    def validate_blobs(self, blobs, concurrency=1, max_queued_batches=2):
+        """
+        Validates messages from blobs against a schema, reading several blobs at once
 
-        try:
-            media_url = blob.generate_signed_url(
-                expiration=timedelta(seconds=self.max_process_time),
-                method="GET",
-                version="v4",
+        Returns the aggregated findings of the messages that are not conform
+        """
+
+        blobs = [blob for blob in blobs if blob.content_type == "application/x-xz"]
+        if self.sampler:
+            # Spread the blobs that are sampled before the deadline over the day
+            blobs = sampling.interleave(blobs)
+
+        pipeline = BlobPipeline(self.read_blob, concurrency, max_queued_batches)
+        failed_blobs = set()
+
+        with closing(
+            pipeline.iterate(
+                blobs, deadline=self.process_start_time + self.max_process_time
             )
-            chunk_size = 256000  # 250KB
-            stream = io.BytesIO()
-            count = 0
+        ) as batches:
+            for blob, batch, error in batches:
+                if batch is None and error is None:
+                    self.blobs_validated.add(blob.name)
+                    self.checkpoints.pop(blob.name, None)
+                    continue
+
+                if error is not None:
+                    logging.error(f"Could not unzip blob because of {str(error)}")
+                    self.findings.add_blob_error(
+                        topic_name=self.topic_name,
+                        schema_tag=self.schema_tag,
+                        history_bucket=self.messages_bucket_name,
+                        blob_name=blob.name,
+                        error=f"Could not unzip blob because of {str(error)}",
+                    )
+                    continue
+
+                if blob.name in failed_blobs:
+                    continue
+
+                messages, offset = batch
+                self.messages_read += len(messages)
+                if self.sampler:
+                    messages = self.sampler.select(blob.name, messages)
+
+                messages_validated = self.messages_validated
+
+                try:
+                    timed_out = self.validate_json_messages(messages, blob.name)
+                except Exception as e:
+                    # The rest of the blob is not read, like when it cannot be unzipped
+                    logging.error(f"Could not validate blob because of {str(e)}")
+                    self.findings.add_blob_error(
+                        topic_name=self.topic_name,
+                        schema_tag=self.schema_tag,
+                        history_bucket=self.messages_bucket_name,
+                        blob_name=blob.name,
+                        error=f"Could not validate blob because of {str(e)}",
+                    )
+                    failed_blobs.add(blob.name)
+                    pipeline.cancel(blob)
+                    continue
 
-            download = ChunkedDownload(media_url, chunk_size, stream)
-            lzd = lzma.LZMADecompressor(format=lzma.FORMAT_XZ, memlimit=52428800)
+                if self.messages_validated - messages_validated == len(messages):
+                    self.update_checkpoint(blob, offset, len(messages))
+
+                if timed_out:
+                    break
+
+        self.blobs_skipped = [
+            blob.name for blob in blobs if blob.name not in self.blobs_validated
+        ]
+        for blob in blobs:
+            if blob.name in self.blobs_skipped:
+                self.update_checkpoint(blob)
+
+        return self.findings
+
+    def update_checkpoint(self, blob, offset=None, messages=0):
+        """
+        Records up to which offset a blob has been validated
+        """
+
+        checkpoint = self.resume_checkpoint(blob) or {
+            "generation": blob.generation,
+            "schema_hash": self.schema_hash,
+            "offset": 0,
+            "messages": 0,
+            "created": time.time(),
+        }
+
+        if offset is not None:
+            checkpoint["offset"] = offset
+        checkpoint["messages"] += messages
+
+        self.checkpoints[blob.name] = checkpoint
+
+    def resume_checkpoint(self, blob):
+        """
+        Returns the checkpoint of a blob if it can be resumed
+        """
+
+        checkpoint = self.checkpoints.get(blob.name)
+        if checkpoint and checkpoint["generation"] == blob.generation:
+            return checkpoint
+
+        return None
+
+    def read_blob(self, blob):
+        """
+        Downloads and unzips a blob, yields the messages of every downloaded chunk
+        together with the offset in the unzipped blob right after these messages
+        """
+
+        # The media is read with the authorized session, no URL needs to be signed
+        media_url = blob_media_url(blob)
+        stream = DiscardingStream()  # Chunks are unzipped from the responses
+
+        checkpoint = self.resume_checkpoint(blob)
+        offset = checkpoint["offset"] if checkpoint else 0
+
+        xz_stream = None
+        if offset > 0:
+            xz_stream = self.read_xz_index(media_url, blob)
+            blocks = self.blocks_from(xz_stream, offset)
+            if blocks:
+                yield from self.read_blocks(media_url, xz_stream[0], blocks, offset)
+                return
+
+        start, end, skip, header = self.resume_range(blob, offset, xz_stream)
+
+        download = ChunkedDownload(media_url, CHUNK_SIZE, stream, start=start, end=end)
+        chunks = self.download_chunks(download)
+
+        if (
+            offset == 0
+            and self.decompress_workers > 1
+            and (blob.size or 0) > CHUNK_SIZE
+        ):
+            # The index is only read when the first block shows that more follow
+            first_chunk = next(chunks)
+            if xz_index.has_more_blocks(first_chunk, blob.size):
+                xz_stream = self.read_xz_index(media_url, blob)
+                blocks = self.blocks_from(xz_stream, offset)
+                if blocks:
+                    yield from self.read_blocks(media_url, xz_stream[0], blocks, 0)
+                    return
+
+            chunks = chain([first_chunk], chunks)
+
+        lzd = lzma.LZMADecompressor(format=lzma.FORMAT_XZ, memlimit=52428800)
+        lzd.decompress(header)
+        message_stream = JSONArrayStream(
+            offset=offset, in_array=offset > 0, decoder=self.decoder
+        )
+
+        # The next chunks are downloaded while a chunk is unzipped and parsed
+        for content in prefetch(chunks, QUEUED_DOWNLOADS):
+            for data in decompress(lzd, content):
+                if skip > 0:
+                    skipped = min(skip, len(data))
+                    data = data[skipped:]
+                    skip -= skipped
+
+                yield message_stream.feed(data), message_stream.offset
+
+        message_stream.close()
+
+    def download_chunks(self, download):
+        """
+        Yields the content of every chunk of a download
+        """
+
+        while not download.finished:
+            response = download.consume_next_chunk(self.transport)
+            with self._bytes_read_lock:
+                self.bytes_read += len(response.content)
+
+            yield response.content
+
+    def read_xz_index(self, media_url, blob):
+        """
+        Returns the stream flags and the blocks of a blob from its XZ index
+        """
+
+        return xz_index.read_blocks(
+            lambda range_start, range_end: self.read_range(
+                media_url, range_start, range_end
+            ),
+            blob.size,
+        )
+
+    def blocks_from(self, xz_stream, offset):
+        """
+        Returns the blocks from an unzipped offset on when they are read in
+        parallel, or None when the blob is read as one stream
+        """
+
+        if not xz_stream or self.decompress_workers <= 1:
+            return None
 
-            last_json = None
+        blocks = [
+            block
+            for block in xz_stream[1]
+            if block.uncompressed_offset + block.uncompressed_size > offset
+        ]
+        return blocks if len(blocks) > 1 else None
+
+    def read_blocks(self, media_url, stream_flags, blocks, offset):
+        """
+        Downloads and unzips the XZ blocks of a blob in parallel, yields the
+        messages of the unzipped blocks in order like read_blob
 
-            while not download.finished:
-                response = download.consume_next_chunk(self.transport)
-                decoded_data = lzd.decompress(response.content).decode("utf-8")
+        Every block is unzipped on its own behind a stream header, at most
+        decompress_workers blocks are read at the same time. The unzipped parts
+        of the blocks are fed to one message stream in order, so messages that
+        span the edge of two blocks are joined
+        """
 
-                if count == 0:
-                    decoded_data = re.sub(r"^.*?\[\{", "[{", decoded_data)
+        header = xz_index.stream_header(stream_flags)
+        skip = max(0, offset - blocks[0].uncompressed_offset)
+        message_stream = JSONArrayStream(
+            offset=offset, in_array=offset > 0, decoder=self.decoder
+        )
+        stop = threading.Event()
 
-                if last_json:
-                    decoded_data = last_json + decoded_data
+        with ThreadPoolExecutor(
+            max_workers=min(self.decompress_workers, len(blocks))
+        ) as executor:
 
-                new_messages_not_conform_schema, last_json = self.validate_dirty_json(
-                    decoded_data, blob.name
+            def submit(block):
+                parts = queue.Queue(maxsize=QUEUED_PARTS)
+                future = executor.submit(
+                    self.read_block, media_url, header, block, parts, stop
                 )
-                messages_not_conform_schema.extend(new_messages_not_conform_schema)
-                count += 1
+                return future, parts
 
-                if time.time() - self.process_start_time >= self.max_process_time:
-                    break
-        except Exception as e:
-            logging.error(f"Could not unzip blob because of {str(e)}")
-            messages_not_conform_schema.append(
-                {
-                    "schema_tag": self.schema_tag,
-                    "topic_name": self.topic_name,
-                    "history_bucket": self.messages_bucket_name,
-                    "blob_full_name": blob.name,
-                    "type": "blob",
-                    "error": f"Could not unzip blob because of {str(e)}",
-                }
+            pending_blocks = iter(blocks)
+            reads = deque(
+                submit(block)
+                for block in islice(pending_blocks, self.decompress_workers)
             )
 
-        return messages_not_conform_schema
+            try:
+                while reads:
+                    future, parts = reads.popleft()
+                    for block in islice(pending_blocks, 1):
+                        reads.append(submit(block))
 
-    def validate_dirty_json(self, dirty_json, blob_name):
-        messages_not_conform_schema = []
+                    for data in iter(parts.get, None):
+                        if skip > 0:
+                            skipped = min(skip, len(data))
+                            data = data[skipped:]
+                            skip -= skipped
 
-        parsed_json, last_json = self.parse_dirty_json(dirty_json)
+                        yield message_stream.feed(data), message_stream.offset
 
-        for msg in parsed_json:
-            try:
-                jsonschema.validate(msg, self.schema)
-            except (
-                jsonschema.exceptions.ValidationError,
-                jsonschema.exceptions.SchemaError,
-            ) as e:
-                msg_info = {
-                    "schema_tag": self.schema_tag,
-                    "topic_name": self.topic_name,
-                    "history_bucket": self.messages_bucket_name,
-                    "blob_full_name": blob_name,
-                    "type": "schema"
-                    if isinstance(e, jsonschema.exceptions.SchemaError)
-                    else "message",
-                    "error": e,
-                }
-                if msg_info not in messages_not_conform_schema:
-                    messages_not_conform_schema.append(msg_info)
+                    future.result()  # Raises the error of a block
             finally:
-                if time.time() - self.process_start_time >= self.max_process_time:
-                    break
+                stop.set()
+                for future, _ in reads:
+                    future.cancel()
 
-        return messages_not_conform_schema, last_json
+        message_stream.close()
 
-    def parse_dirty_json(self, dirty_json):
+    def read_block(self, media_url, header, block, parts, stop):
         """
-        Parse a dirty string towards a list of JSON objects
+        Downloads an XZ block of a blob and puts it unzipped on a queue in parts
+        of at most CHUNK_SIZE bytes, followed by None
         """
 
-        bracket_strings, timed_out = self.divide_string(
-            dirty_json
-        )  # Divide string into json chunks
+        try:
+            data = self.read_range(
+                media_url,
+                block.compressed_offset,
+                block.compressed_offset + block.compressed_size - 1,
+            )
+            with self._bytes_read_lock:
+                self.bytes_read += len(data)
 
-        parsed_json = []
-        unparsed_json = []
-        for string in bracket_strings:
-            try:
-                json_data = json.loads(string)
-            except json.decoder.JSONDecodeError:
-                unparsed_json.append(string)
-                break
-            else:
-                parsed_json.append(json_data)
-            finally:
-                if time.time() - self.process_start_time >= self.max_process_time:
-                    timed_out = True
-                    break
+            lzd = lzma.LZMADecompressor(format=lzma.FORMAT_XZ, memlimit=52428800)
+            unzipped_size = 0
+            for part in decompress(lzd, header + data, CHUNK_SIZE):
+                unzipped_size += len(part)
+                if not BlobPipeline._put(parts, stop, part):
+                    return
+
+            if unzipped_size != block.uncompressed_size:
+                raise ValueError(
+                    f"Block at offset {block.compressed_offset} unzipped to"
+                    f" {unzipped_size} bytes instead of {block.uncompressed_size}"
+                )
+        finally:
+            BlobPipeline._put(parts, stop, None)
+
+    def read_range(self, media_url, range_start, range_end):
+        """
+        Returns the bytes of a blob between two offsets, both inclusive
+        """
+
+        range_stream = io.BytesIO()
+        Download(
+            media_url, stream=range_stream, start=range_start, end=range_end
+        ).consume(self.transport)
+        return range_stream.getvalue()
+
+    def resume_range(self, blob, offset, xz_stream):
+        """
+        Returns the byte range to download to resume a blob at an unzipped offset
+
+        The download starts at the XZ block that holds the offset, the unzipped
+        bytes before the offset within that block are skipped. Returns the start
+        and end of the range, the number of bytes to skip and the stream header
+        that precedes the block
+        """
+
+        if offset == 0:
+            return 0, None, 0, b""
+
+        if not xz_stream:
+            return 0, None, offset, b""
 
-        last_json = (
-            None if timed_out or len(unparsed_json) == 0 else "".join(unparsed_json)
+        stream_flags, blocks = xz_stream
+        block = xz_index.find_block(blocks, offset)
+        if block.compressed_offset == xz_index.HEADER_SIZE:
+            return 0, None, offset, b""
+
+        logging.info(
+            f"Resuming blob {blob.name} at block offset {block.compressed_offset}"
+        )
+        return (
+            block.compressed_offset,
+            blocks[-1].compressed_offset + blocks[-1].compressed_size - 1,
+            offset - block.uncompressed_offset,
+            xz_index.stream_header(stream_flags),
         )
-        return parsed_json, last_json
 
-    def divide_string(self, string):
+    def sample_report(self):
         """
-        Divide string based on { ... } format
+        Returns the sampled message counts and the estimated non-conformance rate
         """
 
-        timed_out = False
-        current_bracket_count = 0
-        current_bracket_string = ""
+        rate, confidence_interval = sampling.estimate(
+            self.messages_validated, self.messages_invalid
+        )
 
-        bracket_strings = []
-        for i, v in enumerate(string):
-            if v == "{":
-                current_bracket_count += 1
-            if v == "}":
-                current_bracket_count -= 1
+        return {
+            "rate": self.sampler.rate,
+            "messages_read": self.messages_read,
+            "sampled": self.messages_validated,
+            "invalid": self.messages_invalid,
+            "estimated_invalid_rate": rate,
+            "confidence_interval": confidence_interval,
+        }
 
-            if current_bracket_count > 0:
-                current_bracket_string = current_bracket_string + v
+    def validate_json_messages(self, messages, blob_name):
+        """
+        Validates parsed messages, adds their errors to the findings and returns
+        whether time ran out
 
-            if current_bracket_count == 0 and len(current_bracket_string) > 0:
-                bracket_strings.append(current_bracket_string + v)
-                current_bracket_string = ""
+        A message is checked for validity first, only the errors of messages
+        that are not valid are collected, up to MAX_MESSAGE_ERRORS per message
+        """
 
+        for msg in messages:
             if time.time() - self.process_start_time >= self.max_process_time:
-                timed_out = True
-                break
+                return True
 
-        if len(current_bracket_string) > 0 and not timed_out:
-            bracket_strings.append(current_bracket_string)
+            self.messages_validated += 1
+            if self.validator.is_valid(msg):
+                continue
 
-        return bracket_strings, timed_out
+            errors = list(
+                islice(self.validator.iter_errors(msg), MAX_MESSAGE_ERRORS + 1)
+            )
+            if not errors:
+                continue
+
+            self.messages_invalid += 1
+            self.findings.add_message_error(
+                topic_name=self.topic_name,
+                schema_tag=self.schema_tag,
+                history_bucket=self.messages_bucket_name,
+                blob_name=blob_name,
+                e=jsonschema.exceptions.best_match(iter(errors)),
+                errors=errors[:MAX_MESSAGE_ERRORS],
+                errors_truncated=len(errors) > MAX_MESSAGE_ERRORS,
+            )
+
+        return time.time() - self.process_start_time >= self.max_process_time
 
 
 class TopicProcessor(object):
@@ -205,132 +543,688 @@ class TopicProcessor(object):
         stg_client_ext,
         credentials_ext,
         schemas_bucket_name,
-        max_process_time,
-        total_topics,
+        download_concurrency=1,
+        max_queued_chunks=2,
+        schema_ref_mode="inline",
+        decompress_workers=1,
     ):
         """
         Initializes a class for processing topic data
+
+        In the "registry" schema reference mode, references in schemas are not
+        filled in but resolved from a store of the referenced schemas
         """
 
         self.stg_client = stg_client
         self.stg_client_ext = stg_client_ext
         self.credentials_ext = credentials_ext
 
-        self.max_process_time = max_process_time
-        self.total_topics = total_topics
+        self.download_concurrency = download_concurrency
+        self.max_queued_chunks = max_queued_chunks
 
         self.schemas_bucket_name = schemas_bucket_name
+        self.schema_ref_mode = schema_ref_mode
+        self.decompress_workers = decompress_workers
+
+    @property
+    def bucket_prefix(self):
+        """
+        Returns the prefix of the blobs of yesterday, a worker process is kept
+        between invocations and must not hold on to the day it was started
+        """
 
         yesterday = datetime.now() - timedelta(1)
-        self.bucket_prefix = datetime.strftime(yesterday, "%Y/%m/%d")
+        return datetime.strftime(yesterday, "%Y/%m/%d")
 
-    def validate_topic_messages(self, topic_schema):
+    def validate_topic_messages(
+        self, topic_schema, max_process_time, topic_blobs=None, checkpoints=None
+    ):
         """
         Validates a topic schema with help from Pub/Sub backup messages
+
+        Returns whether the topic could be validated, the aggregated findings of
+        its invalid messages and a report of how much of the topic was validated, including the checkpoints
+        of the blobs that were not validated completely
         """
 
         process_start_time = time.time()
 
         topic_name = topic_schema["topic_name"]
         topic_schema_tag = topic_schema["schema_tag"]
+        topic_sample_rate = topic_schema.get("sample_rate")
         topic_messages_bucket_name = f"{topic_name}-history-stg"
 
-        topic_schema = self.retrieve_topic_schema(
+        topic_report = {
+            "topic_name": topic_name,
+            "blobs": 0,
+            "skipped_blobs": [],
+            "bytes": 0,
+            "messages": 0,
+            "seconds": 0,
+            "complete": False,
+            "checkpoints": None,
+            "sample": None,
+            "peak_memory": None,
+            "decoder": None,
+        }
+
+        cached_schema = self.retrieve_topic_schema(
             topic_schema_tag
         )  # Retrieve the topic schema
-        if not topic_schema:
+        if not cached_schema or not cached_schema.schema:
             logging.info(f"No valid schema found for topic '{topic_name}'")
-            return False, None
+            return False, None, topic_report
 
-        topic_blobs = list(
-            self.stg_client_ext.list_blobs(
-                topic_messages_bucket_name, prefix=self.bucket_prefix
+        try:
+            validator = validator_registry.get(
+                topic_schema_tag,
+                cached_schema.schema,
+                cached_schema.schema_hash,
+                cached_schema.store,
             )
-        )
+        except jsonschema.exceptions.SchemaError as e:
+            topic_report["seconds"] = time.time() - process_start_time
+            topic_findings = FindingAggregator()
+            topic_findings.add_schema_error(
+                topic_name=topic_name,
+                schema_tag=topic_schema_tag,
+                history_bucket=topic_messages_bucket_name,
+                e=e,
+            )
+            return True, topic_findings, topic_report
+
+        if topic_blobs is None:
+            topic_blobs = self.list_topic_blobs(topic_name, checkpoints)
 
         if len(topic_blobs) == 0:
             logging.info(
                 f"No new messages of topic '{topic_name}' were published yesterday"
             )
-            self.update_max_process_time(process_start_time)
-            return True, []
+            topic_report["seconds"] = time.time() - process_start_time
+            topic_report["complete"] = True
+            topic_report["checkpoints"] = {}
+            return True, FindingAggregator(), topic_report
         else:
             logging.info(
                 f"The messages of topic '{topic_name}' are validated against schema '{topic_schema_tag}'"
             )
-            topic_invalid_messages = []
-
             message_validator = MessageValidator(
                 credentials_ext=self.credentials_ext,
                 topic_name=topic_name,
                 messages_bucket_name=topic_messages_bucket_name,
-                schema=topic_schema,
+                validator=validator,
                 schema_tag=topic_schema_tag,
-                max_process_time=self.max_process_time,
+                max_process_time=max_process_time,
                 process_start_time=process_start_time,
+                schema_hash=cached_schema.schema_hash,
+                checkpoints=checkpoints,
+                sample_rate=topic_sample_rate,
+                decompress_workers=self.decompress_workers,
+            )
+            topic_findings = message_validator.validate_blobs(
+                topic_blobs,
+                concurrency=self.download_concurrency,
+                max_queued_batches=self.max_queued_chunks,
+            )
+
+            # Checkpoints of blobs that were not listed again are given up on
+            topic_blob_names = {blob.name for blob in topic_blobs}
+            topic_checkpoints = {
+                blob_name: checkpoint
+                for blob_name, checkpoint in message_validator.checkpoints.items()
+                if blob_name in topic_blob_names
+            }
+
+            topic_report.update(
+                blobs=len(message_validator.blobs_validated)
+                + len(message_validator.blobs_skipped),
+                skipped_blobs=message_validator.blobs_skipped,
+                bytes=message_validator.bytes_read,
+                messages=message_validator.messages_validated,
+                seconds=time.time() - process_start_time,
+                complete=len(message_validator.blobs_skipped) == 0,
+                checkpoints=topic_checkpoints,
+                peak_memory=peak_memory(),
+                decoder={
+                    "name": message_validator.decoder.name,
+                    "bytes": message_validator.decoder.bytes_decoded,
+                    "seconds": message_validator.decoder.seconds,
+                },
+            )
+            if message_validator.sampler:
+                topic_report["sample"] = message_validator.sample_report()
+
+            return True, topic_findings, topic_report
+
+    def list_topic_blobs(self, topic_name, checkpoints=None):
+        """
+        Lists the blobs of yesterday in the history bucket of a topic, preceded by
+        the blobs of earlier days that still have a checkpoint
+        """
+
+        topic_messages_bucket_name = f"{topic_name}-history-stg"
+
+        topic_blobs = list(
+            self.stg_client_ext.list_blobs(
+                topic_messages_bucket_name, prefix=self.bucket_prefix
+            )
+        )
+
+        topic_blob_names = {blob.name for blob in topic_blobs}
+        checkpointed_blobs = []
+        for blob_name, checkpoint in sorted((checkpoints or {}).items()):
+            if blob_name in topic_blob_names:
+                continue
+
+            if time.time() - checkpoint["created"] > MAX_CHECKPOINT_AGE:
+                logging.warning(
+                    f"Giving up on validating blob {blob_name} of topic '{topic_name}'"
+                )
+                continue
+
+            blob = self.stg_client_ext.bucket(topic_messages_bucket_name).get_blob(
+                blob_name
             )
-            for blob in topic_blobs:
-                invalid_messages = message_validator.validate(blob)
-                topic_invalid_messages.extend(invalid_messages)
+            if blob and blob.generation == checkpoint["generation"]:
+                checkpointed_blobs.append(blob)
+
+        return checkpointed_blobs + topic_blobs
+
+    def blobs_from_resources(self, topic_name, blob_resources):
+        """
+        Returns the blobs of a topic from the resources they were listed with,
+        so a worker process does not list the blobs of its topic again
+        """
+
+        bucket = self.stg_client_ext.bucket(f"{topic_name}-history-stg")
+
+        topic_blobs = []
+        for blob_resource in blob_resources:
+            blob = Blob(blob_resource["name"], bucket=bucket)
+            blob._set_properties(blob_resource)
+            topic_blobs.append(blob)
+
+        return topic_blobs
+
+    def list_topics_blobs(self, topics_checkpoints):
+        """
+        Lists the blobs of several topics at once, None for topics that failed
+        """
+
+        def list_or_none(topic_name):
+            try:
+                return self.list_topic_blobs(topic_name, topics_checkpoints[topic_name])
+            except Exception as e:
+                logging.error(f"Could not list blobs of topic '{topic_name}': {e}")
+                return None
 
-            self.update_max_process_time(process_start_time)
-            return True, topic_invalid_messages
+        topic_names = list(topics_checkpoints)
+        with ThreadPoolExecutor(max_workers=self.download_concurrency) as executor:
+            return dict(zip(topic_names, executor.map(list_or_none, topic_names)))
 
     def retrieve_topic_schema(self, topic_schema_tag):
         """
         Retrieves and parses the topic schema from a schemas bucket
+
+        The bundled schema, of which the references were filled in when it was
+        stored, is used when it exists. In the registry mode the schema is used
+        with a store of the schemas it references instead. Only the metadata of
+        the schema is retrieved when its generation was resolved before
         """
 
         schema_tag_simple = topic_schema_tag.replace("/", "_")
 
         try:
-            schemas_bucket = self.stg_client.get_bucket(self.schemas_bucket_name)
+            schemas_bucket = self.stg_client.bucket(self.schemas_bucket_name)
+
+            if self.schema_ref_mode == "registry":
+                schema_blob = schemas_bucket.get_blob(schema_tag_simple)
+                return schema_cache.get(
+                    schema_blob,
+                    lambda: self.build_schema_store(
+                        json.loads(schema_blob.download_as_string()),
+                        shared_transport.default_session(),
+                    ),
+                )
+
+            bundle_blob = schemas_bucket.get_blob(BUNDLE_PREFIX + schema_tag_simple)
+            if bundle_blob is not None:
+                return schema_cache.get(
+                    bundle_blob,
+                    lambda: (json.loads(bundle_blob.download_as_string()), None),
+                    expires=False,
+                )
+
             schema_blob = schemas_bucket.get_blob(schema_tag_simple)
-            schema = json.loads(schema_blob.download_as_string())
+            return schema_cache.get(
+                schema_blob,
+                lambda: (
+                    fill_refs(
+                        json.loads(schema_blob.download_as_string()),
+                        shared_transport.default_session(),
+                    ),
+                    None,
+                ),  # Fill references within the schema
+            )
         except Exception as e:
             logging.error(f"Could not download schema '{schema_tag_simple}' due to {e}")
-            pass
-        else:
-            return fill_refs(schema)  # Fill references within the schema
 
-    def update_max_process_time(self, start_time):
+    @staticmethod
+    def build_schema_store(schema, session=None):
         """
-        Updates left maximum process time for future topics
+        Returns a schema with a store of all schemas it references keyed by $id
         """
 
-        if self.total_topics > 1:
-            self.total_topics = self.total_topics - 1
+        return schema_registry.build_store(schema, prefetch_schemas(schema, session))
 
-        process_time_left = self.max_process_time - (time.time() - start_time)
-        self.max_process_time = self.max_process_time + (
-            process_time_left / self.total_topics
-        )
+
+def decompress(lzd, data, max_length=262144):
+    """
+    Yields the decompressed data in parts of at most max_length bytes, so that a
+    small and well compressed chunk does not produce one huge batch of messages
+    """
+
+    yield lzd.decompress(data, max_length=max_length)
+
+    while not lzd.needs_input and not lzd.eof:
+        yield lzd.decompress(b"", max_length=max_length)
 
 
-def retrieve_topics_schema(bucket):
+def retrieve_topics_schema(bucket, concurrency=8):
     """
     Retrieves the info of all data-catalogs topics with a valid schema
+
+    The topics are read from the topic index that is kept by the function that
+    ingests data catalogs. Without an index the data catalogs are downloaded
+    concurrently, catalogs of which the generation did not change since an
+    earlier run on this instance are not downloaded
+    """
+
+    index_topics = topic_index.read_topic_index(bucket)
+    if index_topics is not None:
+        catalog_topics = []
+        for topic_name, topic in index_topics.items():
+            catalog_topic = {
+                "schema_tag": topic["schema_tag"],
+                "topic_name": topic_name,
+            }
+            if "sample_rate" in topic:
+                sample_rate = topic_index.parse_sample_rate(
+                    topic["sample_rate"], topic_name
+                )
+                if sample_rate is not None:
+                    catalog_topic["sample_rate"] = sample_rate
+
+            catalog_topics.append(catalog_topic)
+
+        return catalog_topics
+
+    logging.info("No topic index found, reading all data catalogs")
+
+    blobs = [
+        blob
+        for blob in bucket.list_blobs()
+        if not blob.name.startswith(topic_index.INDEX_PREFIX)
+    ]
+
+    def retrieve_catalog_topics(blob):
+        cached_catalog = catalog_cache.get(blob.name)
+        if cached_catalog and cached_catalog[0] == blob.generation:
+            return cached_catalog[1]
+
+        topics = get_catalog_topics(json.loads(blob.download_as_string()))
+        catalog_cache[blob.name] = (blob.generation, topics)
+        return topics
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(concurrency, len(blobs)))
+    ) as executor:
+        catalogs_topics = list(executor.map(retrieve_catalog_topics, blobs))
+
+    # Forget the catalogs that were removed
+    blob_names = {blob.name for blob in blobs}
+    for blob_name in [name for name in catalog_cache if name not in blob_names]:
+        del catalog_cache[blob_name]
+
+    return [
+        dict(catalog_topic)
+        for catalog_topics in catalogs_topics
+        for catalog_topic in catalog_topics
+    ]
+
+
+def get_catalog_topics(catalog):
+    """
+    Returns the info of the topics with a valid schema in a data catalog
     """
 
     catalog_topics = []
 
-    for blob in bucket.list_blobs():
-        catalog = json.loads(blob.download_as_string())
-
-        for dataset in catalog["dataset"]:
-            for dist in dataset.get("distribution", []):
-                if dist.get("format") == "topic":
-                    if "describedBy" in dist and "describedByType" in dist:
-                        catalog_topics.append(
-                            {
-                                "schema_tag": dist["describedBy"],
-                                "topic_name": dist.get("title", "unknown"),
-                            }
+    for dataset in catalog["dataset"]:
+        for dist in dataset.get("distribution", []):
+            if dist.get("format") == "topic":
+                if "describedBy" in dist and "describedByType" in dist:
+                    catalog_topic = {
+                        "schema_tag": dist["describedBy"],
+                        "topic_name": dist.get("title", "unknown"),
+                    }
+                    if "validationSampleRate" in dist:
+                        sample_rate = topic_index.parse_sample_rate(
+                            dist["validationSampleRate"], catalog_topic["topic_name"]
                         )
+                        if sample_rate is not None:
+                            catalog_topic["sample_rate"] = sample_rate
+
+                    catalog_topics.append(catalog_topic)
 
     return catalog_topics
 
 
+def available_cpus():
+    """
+    Returns the number of CPUs this process may run on
+    """
+
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def pool_size(download_concurrency, decompress_workers):
+    """
+    Returns how many connections are used at most to download blobs at once
+    """
+
+    return max(1, download_concurrency) * max(1, decompress_workers)
+
+
+def blob_media_url(blob):
+    """
+    Returns the URL of the media of a blob at the generation it was listed with
+    """
+
+    if blob.media_link:
+        return blob.media_link
+
+    return MEDIA_URL.format(
+        bucket=quote(blob.bucket.name, safe=""),
+        name=quote(blob.name, safe=""),
+        generation=blob.generation,
+    )
+
+
+def log_decode_throughput(topic_reports):
+    """
+    Logs how fast the messages were decoded per JSON decoder
+    """
+
+    throughput = {}
+    for topic_report in topic_reports:
+        if topic_report["decoder"]:
+            decoded = throughput.setdefault(topic_report["decoder"]["name"], [0, 0.0])
+            decoded[0] += topic_report["decoder"]["bytes"]
+            decoded[1] += topic_report["decoder"]["seconds"]
+
+    for name, (decoded_bytes, seconds) in throughput.items():
+        logging.info(
+            f"JSON decoder '{name}' decoded {decoded_bytes / 1048576:.1f} MiB"
+            f" in {seconds:.2f}s ({decoded_bytes / 1048576 / max(seconds, 1e-9):.1f} MiB/s)"
+        )
+
+
+def peak_memory():
+    """
+    Returns the peak resident memory of this process in bytes
+    """
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def init_topic_worker(
+    schemas_bucket_name,
+    download_concurrency,
+    max_queued_chunks,
+    schema_ref_mode,
+    decompress_workers,
+):
+    """
+    Initializes the clients of a process that validates topics
+    """
+
+    credentials_ext, project_id = auth.request_auth_token()
+    shared_transport.configure(pool_size(download_concurrency, decompress_workers))
+
+    topic_worker["topic_processor"] = TopicProcessor(
+        stg_client=shared_transport.storage_client(),
+        stg_client_ext=shared_transport.storage_client(credentials_ext),
+        credentials_ext=credentials_ext,
+        schemas_bucket_name=schemas_bucket_name,
+        download_concurrency=download_concurrency,
+        max_queued_chunks=max_queued_chunks,
+        schema_ref_mode=schema_ref_mode,
+        decompress_workers=decompress_workers,
+    )
+
+
+def validate_topic_in_worker(
+    topic_schema, max_process_time, checkpoints, blob_resources=None
+):
+    """
+    Validates the messages of a topic within a worker process
+
+    The blobs of the topic are given as the resources they were listed with by
+    the parent process, they are only listed again when the parent could not
+    """
+
+    # The worker outlives an invocation, its delegated token is refreshed in place
+    auth.request_auth_token()
+
+    topic_processor = topic_worker["topic_processor"]
+    topic_blobs = None
+    if blob_resources is not None:
+        topic_blobs = topic_processor.blobs_from_resources(
+            topic_schema["topic_name"], blob_resources
+        )
+
+    return topic_processor.validate_topic_messages(
+        topic_schema, max_process_time, topic_blobs, checkpoints
+    )
+
+
+def validate_topics_serially(scheduler, topic_processor, topics_blobs):
+    """
+    Validates the messages of topics one after another in the order of the scheduler
+    """
+
+    topic_results = []
+
+    while True:
+        topic_schema, max_process_time = scheduler.next_topic()
+        if topic_schema is None:
+            break
+
+        try:
+            topic_results.append(
+                topic_processor.validate_topic_messages(
+                    topic_schema,
+                    max_process_time,
+                    topics_blobs.get(topic_schema["topic_name"]),
+                    scheduler.checkpoints(topic_schema["topic_name"]),
+                )
+            )  # Validate messages for topic
+        except Exception as e:
+            logging.error(
+                f"Could not validate topic '{topic_schema['topic_name']}' because of {e}"
+            )
+
+    return topic_results
+
+
+def get_worker_pool(worker_processes, worker_args):
+    """
+    Returns the process pool of this instance, which is kept between invocations
+    so the clients and caches of its workers are reused
+
+    A new pool is started when the settings of the pool changed
+    """
+
+    if worker_pool.get("settings") != (worker_processes, worker_args):
+        shutdown_worker_pool()
+
+        worker_pool["executor"] = ProcessPoolExecutor(
+            max_workers=worker_processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_topic_worker,
+            initargs=worker_args,
+        )
+        worker_pool["settings"] = (worker_processes, worker_args)
+
+    return worker_pool["executor"]
+
+
+def shutdown_worker_pool(terminate=False):
+    """
+    Stops the process pool of this instance, if any, terminating its workers
+    when they may be hanging
+    """
+
+    executor = worker_pool.pop("executor", None)
+    worker_pool.pop("settings", None)
+
+    if executor is not None:
+        if terminate:
+            # A hanging worker would otherwise keep running after the shutdown
+            for process in list((getattr(executor, "_processes", None) or {}).values()):
+                process.terminate()
+
+        executor.shutdown(wait=False)
+
+
+def validate_topics_in_processes(
+    scheduler, worker_processes, worker_args, topics_blobs=None
+):
+    """
+    Validates the messages of topics across a pool of processes
+
+    The blobs that were listed for the scheduler are passed to the workers as
+    their resources, so they are not listed again
+    """
+
+    topic_results = []
+    topics_blobs = topics_blobs or {}
+
+    executor = get_worker_pool(worker_processes, worker_args)
+    running = {}
+
+    while True:
+        while len(running) < worker_processes:
+            topic_schema, max_process_time = scheduler.next_topic()
+            if topic_schema is None:
+                break
+
+            topic_blobs = topics_blobs.get(topic_schema["topic_name"])
+            future = executor.submit(
+                validate_topic_in_worker,
+                topic_schema,
+                max_process_time,
+                scheduler.checkpoints(topic_schema["topic_name"]),
+                (
+                    None
+                    if topic_blobs is None
+                    else [blob._properties for blob in topic_blobs]
+                ),
+            )
+            running[future] = topic_schema
+
+        if not running:
+            break
+
+        done, _ = wait(
+            running,
+            timeout=max(0, scheduler.deadline + WORKER_GRACE_TIME - time.time()),
+            return_when=FIRST_COMPLETED,
+        )
+        if not done:
+            # The topics still running are given up on, so the results of the
+            # other topics can be published before the function times out
+            logging.error("Worker processes did not finish before the deadline")
+            scheduler.skipped_topics.extend(
+                topic_schema["topic_name"] for topic_schema in running.values()
+            )
+            scheduler.skip_pending()
+            shutdown_worker_pool(terminate=True)
+            break
+
+        for future in done:
+            topic_schema = running.pop(future)
+
+            try:
+                topic_results.append(future.result())
+            except BrokenProcessPool as e:
+                # A worker died, the topics left are skipped and the next
+                # invocation starts a new pool
+                shutdown_worker_pool()
+                scheduler.skip_pending()
+                logging.error(
+                    f"Could not validate topic '{topic_schema['topic_name']}' because of {e}"
+                )
+            except Exception as e:
+                logging.error(
+                    f"Could not validate topic '{topic_schema['topic_name']}' because of {e}"
+                )
+
+    return topic_results
+
+
+def get_publisher():
+    """
+    Returns the batching publisher of this instance, created on first use
+    """
+
+    global publisher
+    if publisher is None:
+        publisher = pubsub_v1.PublisherClient(batch_settings=PUBLISH_BATCH_SETTINGS)
+
+    return publisher
+
+
+def publish_issues(issues, gobits):
+    """
+    Publishes all issues at once and waits for them together
+
+    Returns the number of issues that could not be published
+    """
+
+    issue_futures = []
+    for issue in issues:
+        message = {"issue": issue, "gobits": gobits}
+        issue_futures.append(
+            (
+                issue,
+                get_publisher().publish(
+                    config.TOPIC_NAME, json.dumps(message).encode("utf-8")
+                ),
+            )
+        )
+
+    failed = 0
+    for issue, future in issue_futures:
+        try:
+            message_id = future.result(timeout=PUBLISH_TIMEOUT)
+        except Exception as e:
+            failed += 1
+            logging.error(
+                f"Could not publish issue of topic '{issue['topic_name']}' because: {e}"
+            )
+        else:
+            logging.info(
+                f"Published message from {issue['topic_name']} with id {message_id}"
+            )
+
+    return failed
+
+
 # flake8: noqa: C901
 def validate_messages(request):
     logging.info("Initialized function")
@@ -338,61 +1232,157 @@ def validate_messages(request):
     try:
         catalogs_bucket_name = os.environ.get("DATA_CATALOGS_BUCKET_NAME")
         schemas_bucket_name = os.environ.get("SCHEMAS_BUCKET_NAME")
+        state_bucket_name = os.environ.get("STATE_BUCKET_NAME")
         timeout = int(os.environ.get("TIMEOUT", 540))
+        download_concurrency = int(os.environ.get("DOWNLOAD_CONCURRENCY", 4))
+        max_queued_chunks = int(
+            os.environ.get("MAX_QUEUED_CHUNKS", 2 * download_concurrency)
+        )
+        execution_mode = os.environ.get("EXECUTION_MODE", "serial")
+        worker_processes = int(os.environ.get("WORKER_PROCESSES", available_cpus()))
+        catalog_concurrency = int(os.environ.get("CATALOG_CONCURRENCY", 8))
+        schema_ref_mode = os.environ.get("SCHEMA_REF_MODE", "inline")
+        decompress_workers = int(os.environ.get("DECOMPRESS_WORKERS", available_cpus()))
     except KeyError as e:
         logging.error(f"Function is missing required environment variable: {str(e)}")
         return "Bad Request", 400
 
+    start_time = time.time()
+
     credentials_ext, project_id = auth.request_auth_token()
 
-    stg_client = storage.Client()
-    stg_client_ext = storage.Client(credentials=credentials_ext)
+    # Clients and their connections are kept between invocations
+    shared_transport.configure(
+        max(pool_size(download_concurrency, decompress_workers), catalog_concurrency)
+    )
+    stg_client = shared_transport.storage_client()
+    stg_client_ext = shared_transport.storage_client(credentials_ext)
 
     topic_schemas = retrieve_topics_schema(
-        bucket=stg_client.get_bucket(catalogs_bucket_name)
+        bucket=stg_client.bucket(catalogs_bucket_name),
+        concurrency=catalog_concurrency,
     )
     if len(topic_schemas) == 0:
         logging.info("No topics to process")
     else:
-        invalid_messages = []
-        validation_time_per_topic = (timeout - 30) / len(topic_schemas)
-
         topic_processor = TopicProcessor(
             stg_client=stg_client,
             stg_client_ext=stg_client_ext,
             credentials_ext=credentials_ext,
             schemas_bucket_name=schemas_bucket_name,
-            max_process_time=validation_time_per_topic,
-            total_topics=len(topic_schemas),
+            download_concurrency=download_concurrency,
+            max_queued_chunks=max_queued_chunks,
+            schema_ref_mode=schema_ref_mode,
+            decompress_workers=decompress_workers,
         )
+        state_store = StateStore(stg_client, state_bucket_name)
 
-        for topic_schema in topic_schemas:
-            ok_status, topic_invalid_messages = topic_processor.validate_topic_messages(
-                topic_schema
-            )  # Validate messages for topic
+        state_load_start_time = time.time()
+        topic_states = state_store.load_many(
+            [topic_schema["topic_name"] for topic_schema in topic_schemas],
+            concurrency=catalog_concurrency,
+        )
+        # Saving the states afterwards is expected to take as long as loading them
+        deadline = (
+            start_time + timeout - RESERVED_TIME - (time.time() - state_load_start_time)
+        )
+
+        topics_blobs = topic_processor.list_topics_blobs(
+            {
+                topic_name: topic_state.get("checkpoints", {})
+                for topic_name, topic_state in topic_states.items()
+            }
+        )
+        topic_sizes = {
+            topic_name: sum(
+                blob.size or 0
+                for blob in topic_blobs
+                if blob.content_type == "application/x-xz"
+            )
+            for topic_name, topic_blobs in topics_blobs.items()
+            if topic_blobs
+        }
+
+        if execution_mode == "process" and worker_processes > 1:
+            worker_processes = min(worker_processes, len(topic_schemas))
+            scheduler = TopicScheduler(
+                topic_schemas, topic_sizes, topic_states, deadline, worker_processes
+            )
+            topic_results = validate_topics_in_processes(
+                scheduler=scheduler,
+                worker_processes=worker_processes,
+                worker_args=(
+                    schemas_bucket_name,
+                    download_concurrency,
+                    max_queued_chunks,
+                    schema_ref_mode,
+                    decompress_workers,
+                ),
+                topics_blobs=topics_blobs,
+            )
+        else:
+            scheduler = TopicScheduler(
+                topic_schemas, topic_sizes, topic_states, deadline
+            )
+            topic_results = validate_topics_serially(
+                scheduler, topic_processor, topics_blobs
+            )
 
+        findings = FindingAggregator()
+        topic_reports = []
+        topic_samples = {}
+        updated_states = {}
+        for ok_status, topic_findings, topic_report in topic_results:
             if ok_status:
-                invalid_messages.extend(topic_invalid_messages)
+                findings.merge(topic_findings)
+                topic_reports.append(topic_report)
+                updated_states[topic_report["topic_name"]] = scheduler.update_state(
+                    topic_report
+                )
+
+                if topic_report["sample"]:
+                    topic_samples[topic_report["topic_name"]] = topic_report["sample"]
+                    logging.info(
+                        f"Topic '{topic_report['topic_name']}' was sampled: "
+                        + sampling.describe(topic_report["sample"])
+                    )
+
+        state_store.save_many(updated_states, concurrency=catalog_concurrency)
+
+        scheduler.log_report(topic_reports)
+        # Topics validated in worker processes report the peak of their process
+        peak_memory_used = max(
+            [peak_memory()]
+            + [
+                report["peak_memory"]
+                for report in topic_reports
+                if report["peak_memory"]
+            ]
+        )
+        logging.info(f"Peak memory use was {peak_memory_used / 1048576:.0f} MiB")
+        log_decode_throughput(topic_reports)
 
-        if len(invalid_messages) > 0:
+        if len(findings) > 0:
             try:
                 error_messages = []
-                for msg_info in invalid_messages:
+                for finding in findings.findings():
                     (
                         title,
                         comment,
-                        comment_info,
                         comment_error,
                         comment_schema_key,
-                        made_comments,
-                    ) = tickets.get_issue_information(msg_info, [])
+                    ) = tickets.get_issue_information(finding)
 
                     description = (
-                        f"The topic `{msg_info['topic_name']}` received messages"
-                        + f" that are not conform its schema ({msg_info['schema_tag']})."
+                        f"The topic `{finding['topic_name']}` received messages"
+                        + f" that are not conform its schema ({finding['schema_tag']})."
                         + " The messages with their errors can be found in the comments of this ticket"
                         + " Please check why the messages are not conform the schema. "
                     )
+                    if finding["topic_name"] in topic_samples:
+                        description += sampling.describe(
+                            topic_samples[finding["topic_name"]]
+                        )
 
                     error_messages.append(
                         {
@@ -401,34 +1391,28 @@ def validate_messages(request):
                             "comment": comment,
                             "comment_error": comment_error,
                             "comment_schema_key": comment_schema_key,
-                            "schema": msg_info["schema_tag"],
-                            "topic_name": msg_info["topic_name"],
-                            "bucket": msg_info["history_bucket"],
-                            "blob_name": msg_info["blob_full_name"],
+                            "schema": finding["schema_tag"],
+                            "topic_name": finding["topic_name"],
+                            "bucket": finding["history_bucket"],
+                            "blob_name": finding["first_blob"],
+                            "fingerprint": finding["fingerprint"],
+                            "count": finding["count"],
                         }
                     )
 
-                # Delete duplicate error messages
-                error_messages = [
-                    dict(t)
-                    for t in {tuple(message.items()) for message in error_messages}
-                ]
-                for error in error_messages:
-                    error = {
-                        "issue": error,
-                        "gobits": [Gobits.from_request(request=request).to_json()],
-                    }
-                    publisher = pubsub_v1.PublisherClient()
-                    future = publisher.publish(
-                        config.TOPIC_NAME, json.dumps(error).encode("utf-8")
-                    )
-                    logging.info(
-                        f"Published message from {error['issue']['topic_name']} with id {future.result()}"
-                    )
+                failed = publish_issues(
+                    error_messages, [Gobits.from_request(request=request).to_json()]
+                )
             except Exception as e:
                 logging.error(f"Could not publish schema error because: {e}")
                 return "Bad Request", 400
 
+            if failed > 0:
+                logging.error(
+                    f"Could not publish {failed} of {len(error_messages)} schema errors"
+                )
+                return "Bad Request", 400
+
     return "OK", 204
 
 
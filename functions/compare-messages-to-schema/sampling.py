@@ -0,0 +1,90 @@
+import math
+import random
+
+Z_95 = 1.959964
+
+
+class MessageSampler(object):
+    def __init__(self, rate):
+        """
+        Initializes a stratified sampler that takes a fraction of the messages of
+        every blob, spread evenly over the blob
+        """
+
+        self.rate = rate
+
+        self._positions = {}
+
+    def select(self, blob_name, messages):
+        """
+        Returns the sampled messages from the next messages of a blob
+        """
+
+        # Systematic sampling within every blob with a random start per blob
+        position = self._positions.get(blob_name)
+        if position is None:
+            position = random.Random(blob_name).random()
+
+        selected = []
+        for msg in messages:
+            next_position = position + self.rate
+            if math.floor(next_position) > math.floor(position):
+                selected.append(msg)
+            position = next_position
+
+        self._positions[blob_name] = position - math.floor(position)
+        return selected
+
+
+def interleave(blobs):
+    """
+    Orders blobs so that every prefix of the order is spread over the whole list
+    """
+
+    if len(blobs) < 3:
+        return list(blobs)
+
+    bits = (len(blobs) - 1).bit_length()
+    order = sorted(
+        range(len(blobs)), key=lambda i: int(format(i, f"0{bits}b")[::-1], 2)
+    )
+
+    return [blobs[i] for i in order]
+
+
+def estimate(sampled, invalid):
+    """
+    Returns the estimated non-conformance rate with its 95% Wilson score interval
+    """
+
+    if sampled == 0:
+        return None, (0.0, 1.0)
+
+    rate = invalid / sampled
+    denominator = 1 + Z_95**2 / sampled
+    centre = (rate + Z_95**2 / (2 * sampled)) / denominator
+    margin = (
+        Z_95
+        * math.sqrt(rate * (1 - rate) / sampled + Z_95**2 / (4 * sampled**2))
+        / denominator
+    )
+
+    return rate, (max(0.0, centre - margin), min(1.0, centre + margin))
+
+
+def describe(sample):
+    """
+    Returns a sentence that describes the result of sampling a topic
+    """
+
+    if sample["estimated_invalid_rate"] is None:
+        return f"None of the {sample['messages_read']} messages read were sampled. "
+
+    lower, upper = sample["confidence_interval"]
+    return (
+        f"Only {sample['sampled']} of the {sample['messages_read']} messages read were"
+        + f" validated (sample rate {sample['rate']:.2%}), of which {sample['invalid']}"
+        + " were not conform the schema. The estimated non-conformance rate is"
+        + f" {sample['estimated_invalid_rate']:.2%} (95% confidence interval"
+        + f" {lower:.2%} - {upper:.2%}). "
+    )
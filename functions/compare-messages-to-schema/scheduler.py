@@ -0,0 +1,158 @@
+import logging
+import statistics
+import time
+
+DEFAULT_THROUGHPUT = 1000000  # Compressed bytes validated per second
+TOPIC_OVERHEAD = 2  # Seconds needed to retrieve a schema and to list blobs
+MIN_TOPIC_TIME = 5
+MAX_STALENESS = 7 * 24 * 3600
+
+
+class TopicScheduler(object):
+    def __init__(self, topic_schemas, topic_sizes, topic_states, deadline, workers=1):
+        """
+        Initializes a scheduler that divides the time left over topics
+
+        Topics are ordered by how long ago they were fully validated relative to
+        the time they are expected to take, every topic gets a share of the time
+        left that is weighted by its expected validation time
+        """
+
+        self.topic_sizes = topic_sizes
+        self.topic_states = topic_states
+        self.deadline = deadline
+        self.workers = max(1, workers)
+
+        throughputs = [
+            state["bytes_per_second"]
+            for state in topic_states.values()
+            if state.get("bytes_per_second")
+        ]
+        self.default_throughput = (
+            statistics.median(throughputs) if throughputs else DEFAULT_THROUGHPUT
+        )
+
+        self.estimates = {
+            topic_schema["topic_name"]: self.estimate(topic_schema["topic_name"])
+            for topic_schema in topic_schemas
+        }
+        self.pending = sorted(topic_schemas, key=self.priority, reverse=True)
+        self.skipped_topics = []
+
+    def estimate(self, topic_name):
+        """
+        Returns the expected validation time of a topic in seconds
+        """
+
+        state = self.topic_states.get(topic_name, {})
+        throughput = state.get("bytes_per_second") or self.default_throughput
+
+        return TOPIC_OVERHEAD + self.topic_sizes.get(topic_name, 0) / throughput
+
+    def priority(self, topic_schema):
+        """
+        Returns the priority of a topic, higher is validated earlier
+        """
+
+        topic_name = topic_schema["topic_name"]
+        last_full_validation = self.topic_states.get(topic_name, {}).get(
+            "last_full_validation"
+        )
+
+        if last_full_validation is None:
+            staleness = MAX_STALENESS
+        else:
+            staleness = min(MAX_STALENESS, time.time() - last_full_validation)
+
+        return (24 * 3600 + staleness) / self.estimates[topic_name]
+
+    def next_topic(self):
+        """
+        Returns the next topic with its time budget, or None when no topic is left
+        """
+
+        if not self.pending:
+            return None, 0
+
+        time_left = self.deadline - time.time()
+        if time_left < MIN_TOPIC_TIME:
+            self.skip_pending()
+            return None, 0
+
+        topic_schema = self.pending.pop(0)
+
+        estimate = self.estimates[topic_schema["topic_name"]]
+        estimates_left = estimate + sum(
+            self.estimates[pending["topic_name"]] for pending in self.pending
+        )
+        budget = time_left * self.workers * estimate / estimates_left
+
+        return topic_schema, min(time_left, max(MIN_TOPIC_TIME, budget))
+
+    def skip_pending(self):
+        """
+        Skips the topics that were not handed out yet
+        """
+
+        self.skipped_topics.extend(
+            topic_schema["topic_name"] for topic_schema in self.pending
+        )
+        self.pending = []
+
+    def checkpoints(self, topic_name):
+        """
+        Returns the checkpoints of the blobs of a topic that were not fully validated
+        """
+
+        return self.topic_states.get(topic_name, {}).get("checkpoints", {})
+
+    def update_state(self, topic_report):
+        """
+        Returns the state of a topic updated with the report of its validation
+        """
+
+        state = dict(self.topic_states.get(topic_report["topic_name"], {}))
+
+        if topic_report["complete"]:
+            state["last_full_validation"] = time.time()
+
+        if topic_report["checkpoints"] is not None:
+            state["checkpoints"] = topic_report["checkpoints"]
+
+        if topic_report["bytes"] > 0 and topic_report["seconds"] > 0:
+            throughput = topic_report["bytes"] / topic_report["seconds"]
+            previous_throughput = state.get("bytes_per_second")
+            state["bytes_per_second"] = (
+                (previous_throughput + throughput) / 2
+                if previous_throughput
+                else throughput
+            )
+
+        state["last_run"] = {
+            "time": time.time(),
+            "bytes": topic_report["bytes"],
+            "messages": topic_report["messages"],
+            "seconds": topic_report["seconds"],
+            "complete": topic_report["complete"],
+        }
+
+        self.topic_states[topic_report["topic_name"]] = state
+        return state
+
+    def log_report(self, topic_reports):
+        """
+        Logs which topics and blobs could not be validated before the deadline
+        """
+
+        if self.skipped_topics:
+            logging.warning(
+                f"Topics were skipped before they were validated: {self.skipped_topics}"
+            )
+
+        for topic_report in topic_reports:
+            if topic_report["skipped_blobs"]:
+                logging.warning(
+                    f"Deadline reached before validating {len(topic_report['skipped_blobs'])}"
+                    f" of {topic_report['blobs']} blobs of topic '{topic_report['topic_name']}':"
+                    f" {topic_report['skipped_blobs']}"
+                )
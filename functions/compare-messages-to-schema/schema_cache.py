@@ -0,0 +1,123 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from validator_registry import schema_hash
+
+CachedSchema = namedtuple(
+    "CachedSchema",
+    ["name", "generation", "schema", "schema_hash", "created", "store"],
+    defaults=[None],
+)
+
+
+class SchemaCache(object):
+    def __init__(self, cache_dir=None, max_age=3600):
+        """
+        Initializes a cache of resolved schemas keyed by blob name and generation
+
+        The first level is kept in memory and lasts as long as the instance, the
+        optional second level is a directory that is shared with the worker
+        processes of the instance. Resolved schemas older than max_age seconds
+        are resolved again, so changed referenced schemas are picked up as well
+        """
+
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+
+        self._schemas = {}
+        self._lock = threading.Lock()
+
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError as e:
+                logging.warning(f"Could not create schema cache '{cache_dir}': {e}")
+                self.cache_dir = None
+
+    def get(self, blob, resolve, expires=True):
+        """
+        Returns the resolved schema of a schema blob of which only the metadata
+        was retrieved, resolve is only called when the generation is not cached
+
+        resolve returns the schema and the store of the schemas it references,
+        or None as store when references are filled in
+
+        Schemas that do not expire are only resolved again for a new generation,
+        for example bundled schemas that are rebuilt when a reference changes
+        """
+
+        key = (blob.name, blob.generation)
+
+        with self._lock:
+            cached_schema = self._schemas.get(key)
+
+        if cached_schema is None or (expires and self._expired(cached_schema)):
+            cached_schema = self._load(blob)
+
+        if cached_schema is None or (expires and self._expired(cached_schema)):
+            schema, store = resolve()
+            cached_schema = CachedSchema(
+                name=blob.name,
+                generation=blob.generation,
+                schema=schema,
+                schema_hash=schema_hash(schema, store),
+                created=time.time(),
+                store=store,
+            )
+            self._store(cached_schema)
+
+        with self._lock:
+            # Older generations of the same schema are not needed anymore
+            for old_key in [k for k in self._schemas if k[0] == blob.name]:
+                del self._schemas[old_key]
+            self._schemas[key] = cached_schema
+
+        return cached_schema
+
+    def _expired(self, cached_schema):
+        return time.time() - cached_schema.created > self.max_age
+
+    def _path(self, blob):
+        name_hash = hashlib.sha256(blob.name.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{name_hash}-{blob.generation}.json")
+
+    def _load(self, blob):
+        """
+        Returns the resolved schema from the cache directory, if it is there
+        """
+
+        if not self.cache_dir:
+            return None
+
+        try:
+            with open(self._path(blob), "r") as f:
+                return CachedSchema(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Could not read cached schema '{blob.name}': {e}")
+            return None
+
+    def _store(self, cached_schema):
+        """
+        Writes a resolved schema to the cache directory
+        """
+
+        if not self.cache_dir:
+            return
+
+        path = self._path(cached_schema)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(cached_schema._asdict(), f)
+            # Readers in other processes never see a partly written file
+            os.replace(temp_path, path)
+        except Exception as e:
+            logging.warning(f"Could not cache schema '{cached_schema.name}': {e}")
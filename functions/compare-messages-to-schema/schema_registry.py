@@ -0,0 +1,86 @@
+import functools
+import urllib.parse
+
+import jsonschema
+
+
+def build_store(schema, referenced_schemas):
+    """
+    Returns the schema and a store of the schemas it references keyed by $id
+
+    References are kept, so a schema that is referenced in several places is
+    held and validated once. Raises a ValueError when a referenced schema is
+    missing
+    """
+
+    store = {}
+    for blob_name, referenced_schema in referenced_schemas.items():
+        if referenced_schema is None:
+            raise ValueError(f"Referenced schema '{blob_name}' could not be found")
+
+        if "$id" in referenced_schema:
+            store[referenced_schema["$id"]] = rewrite_ref_siblings(referenced_schema)
+
+    return rewrite_ref_siblings(schema), store
+
+
+def rewrite_ref_siblings(node):
+    """
+    Returns a copy of a schema where the keywords next to a $ref are applied too
+
+    Up to draft 7 the keywords next to a $ref are ignored, while filling in
+    references merges them with the referenced schema. The $ref is moved into
+    an allOf next to those keywords to keep validating them
+
+    This is not the same as the merge when a keyword is both next to the $ref
+    and in the referenced schema: the merge keeps only the one that comes last,
+    while both apply here
+    """
+
+    if isinstance(node, list):
+        return [rewrite_ref_siblings(item) for item in node]
+
+    if not isinstance(node, dict):
+        return node
+
+    new_node = {key: rewrite_ref_siblings(value) for key, value in node.items()}
+
+    ref = new_node.get("$ref")
+    if isinstance(ref, str) and len(new_node) > 1:
+        del new_node["$ref"]
+        # An $id next to a $ref was ignored and would change the scope of the $ref
+        new_node.pop("$id", None)
+        new_node["allOf"] = [{"$ref": ref}] + new_node.get("allOf", [])
+
+    return new_node
+
+
+def create_resolver(schema, store):
+    """
+    Returns a reference resolver that finds referenced schemas in the store
+    """
+
+    return jsonschema.RefResolver(
+        base_uri=jsonschema.validators.validator_for(schema).ID_OF(schema) or "",
+        referrer=schema,
+        store=store,
+        urljoin_cache=functools.lru_cache(1024)(join_uri),
+    )
+
+
+def join_uri(base_uri, ref):
+    """
+    Resolves a reference against a base URI, also for URIs like tag: URIs that
+    urljoin does not support relative references for
+    """
+
+    if not base_uri:
+        return ref
+
+    if ref.startswith("#"):
+        return urllib.parse.urldefrag(base_uri)[0] + ref
+
+    if urllib.parse.urlsplit(ref).scheme:
+        return ref
+
+    return urllib.parse.urljoin(base_uri, ref)
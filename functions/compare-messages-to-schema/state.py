@@ -0,0 +1,92 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from google.api_core.exceptions import NotFound
+
+# States of the topics kept by this instance when there is no state bucket
+memory_states = {}
+
+
+class StateStore(object):
+    def __init__(self, stg_client, bucket_name, prefix="topics"):
+        """
+        Initializes a store for the validation state of topics across runs
+
+        Without a bucket name the state is only kept in the memory of this
+        instance, so it is lost when another instance handles the next run
+        """
+
+        self.bucket = stg_client.bucket(bucket_name) if bucket_name else None
+        self.prefix = prefix
+
+        if self.bucket:
+            self._states = {}
+        else:
+            logging.warning(
+                "No state bucket is set, the state of topics and the checkpoints "
+                "of blobs are only kept in memory of this instance"
+            )
+            self._states = memory_states
+
+    def load(self, topic_name):
+        """
+        Returns the stored state of a topic, an empty state if there is none
+        """
+
+        if topic_name in self._states:
+            return self._states[topic_name]
+
+        state = {}
+
+        if self.bucket:
+            try:
+                blob = self.bucket.blob(self.blob_name(topic_name))
+                state = json.loads(blob.download_as_string())
+            except NotFound:
+                pass
+            except Exception as e:
+                logging.error(f"Could not load state of topic '{topic_name}': {e}")
+
+        self._states[topic_name] = state
+        return state
+
+    def load_many(self, topic_names, concurrency=8):
+        """
+        Returns the stored states of several topics, loaded at the same time
+        """
+
+        topic_names = list(topic_names)
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(concurrency, len(topic_names)))
+        ) as executor:
+            return dict(zip(topic_names, executor.map(self.load, topic_names)))
+
+    def save(self, topic_name, state):
+        """
+        Stores the state of a topic
+        """
+
+        self._states[topic_name] = state
+
+        if self.bucket:
+            try:
+                blob = self.bucket.blob(self.blob_name(topic_name))
+                blob.upload_from_string(
+                    data=json.dumps(state), content_type="application/json"
+                )
+            except Exception as e:
+                logging.error(f"Could not save state of topic '{topic_name}': {e}")
+
+    def save_many(self, topic_states, concurrency=8):
+        """
+        Stores the states of several topics at the same time
+        """
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(concurrency, len(topic_states)))
+        ) as executor:
+            list(executor.map(self.save, topic_states, topic_states.values()))
+
+    def blob_name(self, topic_name):
+        return f"{self.prefix}/{topic_name}.json"
@@ -0,0 +1,251 @@
+import unittest
+
+import fast_validator
+import jsonschema
+import schema_registry
+from validator_registry import ValidatorRegistry
+
+DRAFTS = {
+    4: "http://json-schema.org/draft-04/schema#",
+    6: "http://json-schema.org/draft-06/schema#",
+    7: "http://json-schema.org/draft-07/schema#",
+}
+
+INSTANCES = [
+    None,
+    True,
+    False,
+    0,
+    1,
+    -3,
+    1.0,
+    2.5,
+    2**70,
+    "",
+    "a",
+    "ab",
+    "b1",
+    [],
+    [1],
+    [1, "a"],
+    ["a", 1, None],
+    {},
+    {"a": 1},
+    {"a": "x"},
+    {"b": "x"},
+    {"a": 1, "b": "x"},
+    {"a": "x", "c": 1},
+    {"ab": 1, "c": None},
+]
+
+
+class TestFastValidator(unittest.TestCase):
+    def assert_conforms(self, schema, instances=INSTANCES, drafts=DRAFTS, store=None):
+        """
+        Asserts that the generated validator of a schema gives the same result
+        as jsonschema for every instance, in every draft
+        """
+
+        for draft in drafts:
+            draft_schema = dict(schema, **{"$schema": DRAFTS[draft]})
+            validator_class = jsonschema.validators.validator_for(draft_schema)
+            validator_class.check_schema(draft_schema)
+
+            if store is None:
+                validator = validator_class(draft_schema)
+            else:
+                validator = validator_class(
+                    draft_schema,
+                    resolver=schema_registry.create_resolver(draft_schema, store),
+                )
+
+            is_valid = fast_validator.compile_validator(validator)
+            self.assertIsNotNone(is_valid, f"no validator for draft {draft}")
+
+            for instance in instances:
+                with self.subTest(draft=draft, instance=instance):
+                    self.assertEqual(is_valid(instance), validator.is_valid(instance))
+
+    def test_type(self):
+        for schema_type in [
+            "null",
+            "boolean",
+            "integer",
+            "number",
+            "string",
+            "array",
+            "object",
+            ["string", "null"],
+            ["integer", "boolean"],
+        ]:
+            with self.subTest(type=schema_type):
+                self.assert_conforms({"type": schema_type})
+
+    def test_integer_float(self):
+        # Draft 4 does not take 1.0 for an integer, later drafts do
+        self.assert_conforms({"type": "integer"}, [1.0, 1.5, 1, True])
+
+        validator = jsonschema.Draft4Validator({"type": "integer"})
+        self.assertFalse(fast_validator.compile_validator(validator)(1.0))
+
+        validator = jsonschema.Draft7Validator({"type": "integer"})
+        self.assertTrue(fast_validator.compile_validator(validator)(1.0))
+
+    def test_enum(self):
+        self.assert_conforms({"enum": ["a", 1, None, [1], {"a": 1}]})
+
+    def test_enum_booleans(self):
+        # True is not 1 and False is not 0, unlike in Python
+        instances = [True, False, 1, 0, 1.0, 0.0]
+        self.assert_conforms({"enum": [1]}, instances)
+        self.assert_conforms({"enum": [0]}, instances)
+        self.assert_conforms({"enum": [True]}, instances)
+        self.assert_conforms({"enum": [False]}, instances)
+        self.assert_conforms({"enum": [True, 0]}, instances)
+
+    def test_pattern(self):
+        self.assert_conforms({"pattern": "^a"})
+        self.assert_conforms({"pattern": "1$"})
+
+    def test_format(self):
+        # Formats are not checked without a format checker
+        self.assert_conforms({"format": "date-time"})
+
+    def test_required(self):
+        self.assert_conforms({"required": ["a"]})
+        self.assert_conforms({"required": ["a", "b"]})
+
+    def test_properties(self):
+        self.assert_conforms({"properties": {}})
+        self.assert_conforms({"properties": {"a": {"type": "integer"}, "b": {}}})
+
+    def test_pattern_properties(self):
+        self.assert_conforms({"patternProperties": {"^a": {"type": "integer"}}})
+
+    def test_additional_properties(self):
+        self.assert_conforms({"additionalProperties": False})
+        self.assert_conforms({"additionalProperties": {"type": "string"}})
+        self.assert_conforms(
+            {
+                "properties": {"a": {}},
+                "patternProperties": {"^c": {}},
+                "additionalProperties": False,
+            }
+        )
+        self.assert_conforms(
+            {"properties": {"b": {}}, "additionalProperties": {"type": "integer"}}
+        )
+
+    def test_items(self):
+        self.assert_conforms({"items": {"type": "integer"}})
+        self.assert_conforms({"items": [{"type": "integer"}, {"type": "string"}]})
+
+    def test_combinators(self):
+        integer, string = {"type": "integer"}, {"type": "string"}
+        self.assert_conforms({"allOf": [integer, {"enum": [1, "a"]}]})
+        self.assert_conforms({"anyOf": [integer, string]})
+        self.assert_conforms({"oneOf": [integer, {"type": "number"}]})
+        self.assert_conforms({"not": integer})
+
+    def test_boolean_schemas(self):
+        self.assert_conforms(
+            {"properties": {"a": False, "b": True}, "items": False}, drafts=[6, 7]
+        )
+
+    def test_ref_siblings_ignored(self):
+        # Up to draft 7 the keywords next to a $ref are ignored
+        self.assert_conforms(
+            {
+                "definitions": {"s": {"type": "string"}},
+                "properties": {"a": {"$ref": "#/definitions/s", "type": "integer"}},
+            }
+        )
+
+    def test_recursive_ref(self):
+        schema = {
+            "type": "object",
+            "properties": {"a": {"type": "integer"}, "c": {"$ref": "#"}},
+        }
+        self.assert_conforms(
+            schema,
+            INSTANCES
+            + [{"c": {"a": 1}}, {"c": {"a": "x"}}, {"c": {"c": {"c": {"a": "x"}}}}],
+        )
+
+    def test_registry_store_refs(self):
+        referenced = {
+            "$schema": DRAFTS[7],
+            "$id": "tag:vwt.digital,2020:referenced",
+            "definitions": {"n": {"type": "integer", "enum": [1, 2]}},
+            "type": "object",
+            "properties": {"x": {"$ref": "#/definitions/n"}},
+        }
+        schema, store = schema_registry.build_store(
+            {
+                "$id": "tag:vwt.digital,2020:root",
+                "type": "object",
+                "properties": {
+                    "a": {"$ref": "tag:vwt.digital,2020:referenced"},
+                    "b": {"$ref": "#/definitions/s"},
+                },
+                "definitions": {"s": {"type": "string"}},
+            },
+            {"referenced.json": referenced},
+        )
+
+        self.assert_conforms(
+            schema,
+            INSTANCES
+            + [
+                {"a": {"x": 1}, "b": "s"},
+                {"a": {"x": 3}},
+                {"a": {"x": True}},
+                {"a": {"x": 1}, "b": 1},
+            ],
+            drafts=[7],
+            store=store,
+        )
+
+    def test_unsupported_keyword(self):
+        # Schemas with keywords the generator does not support are validated by
+        # jsonschema on its own
+        schema = {"$schema": DRAFTS[7], "properties": {"a": {"minimum": 0}}}
+        self.assertIsNone(
+            fast_validator.compile_validator(jsonschema.Draft7Validator(schema))
+        )
+
+        validator = ValidatorRegistry(engine="codegen").get("unsupported", schema)
+        self.assertIsInstance(validator, jsonschema.Draft7Validator)
+        self.assertFalse(validator.is_valid({"a": -1}))
+
+    def test_registry_engine(self):
+        schema = {"$schema": DRAFTS[7], "properties": {"a": {"type": "integer"}}}
+        validator = ValidatorRegistry(engine="codegen").get("supported", schema)
+
+        self.assertIsInstance(validator, fast_validator.FastValidator)
+        self.assertTrue(validator.is_valid({"a": 1}))
+        self.assertFalse(validator.is_valid({"a": "x"}))
+        self.assertEqual(
+            [error.validator for error in validator.iter_errors({"a": "x"})], ["type"]
+        )
+
+    def test_verified_mismatches_get_errors(self):
+        # Messages that the generated code accepts and the verification rejects
+        # are reported with their errors, without drawing again
+        validator = fast_validator.FastValidator(
+            jsonschema.Draft7Validator({"type": "integer"}), lambda i: True, 0.5
+        )
+
+        rejected = [
+            message for message in range(1000) if not validator.is_valid(str(message))
+        ]
+        self.assertGreater(len(rejected), 0)
+        for message in rejected:
+            self.assertEqual(
+                [error.validator for error in validator.iter_errors(str(message))],
+                ["type"],
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import threading
+
+import google.auth
+import google.auth.transport.requests as tr_requests
+import requests
+from google.cloud import storage
+
+DEFAULT_POOL_SIZE = 10
+
+
+class SharedTransport(object):
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        """
+        Initializes the authorized HTTP sessions and storage clients of a process
+
+        There is one session per set of credentials, so connections and tokens
+        are reused by every topic and by later invocations of a warm instance
+        """
+
+        self.pool_size = pool_size
+
+        self._sessions = {}
+        self._clients = {}
+        self._default_credentials = None
+        self._lock = threading.RLock()
+
+    def configure(self, pool_size):
+        """
+        Grows the connection pools to hold at least pool_size connections
+        """
+
+        with self._lock:
+            if pool_size <= self.pool_size:
+                return
+
+            self.pool_size = pool_size
+            for _, session in self._sessions.values():
+                self._mount(session)
+
+    def session(self, credentials):
+        """
+        Returns the authorized session of a set of credentials
+        """
+
+        with self._lock:
+            entry = self._sessions.get(id(credentials))
+
+            # The credentials are kept with the session, so their id is not reused
+            if entry is None or entry[0] is not credentials:
+                session = tr_requests.AuthorizedSession(credentials)
+                self._mount(session)
+                entry = (credentials, session)
+                self._sessions[id(credentials)] = entry
+
+            return entry[1]
+
+    def default_session(self):
+        """
+        Returns the authorized session of the default credentials of the function
+        """
+
+        with self._lock:
+            return self.session(self.default_credentials()[0])
+
+    def default_credentials(self):
+        """
+        Returns the default credentials of the function with their project
+        """
+
+        with self._lock:
+            if self._default_credentials is None:
+                self._default_credentials = google.auth.default(
+                    scopes=storage.Client.SCOPE
+                )
+
+            return self._default_credentials
+
+    def storage_client(self, credentials=None):
+        """
+        Returns a storage client that uses the session of a set of credentials,
+        or of the default credentials of the function when none are given
+        """
+
+        with self._lock:
+            kwargs = {}
+            if credentials is None:
+                credentials, project = self.default_credentials()
+                if project:
+                    kwargs["project"] = project
+
+            client = self._clients.get(id(credentials))
+            if client is None or client._credentials is not credentials:
+                client = storage.Client(
+                    credentials=credentials, _http=self.session(credentials), **kwargs
+                )
+                self._clients[id(credentials)] = client
+
+            return client
+
+    def _mount(self, session):
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self.pool_size, pool_maxsize=self.pool_size
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
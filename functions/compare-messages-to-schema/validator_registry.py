@@ -0,0 +1,93 @@
+import hashlib
+import json
+import logging
+import threading
+
+import fast_validator
+import jsonschema
+import schema_registry
+
+
+class ValidatorRegistry(object):
+    def __init__(self, engine="jsonschema", verify_rate=0.0):
+        """
+        Initializes a registry of compiled validators keyed by schema tag and hash
+
+        With the "codegen" engine, validators check messages with Python code
+        generated for their schema first, jsonschema gives the errors of the
+        messages that fail and validates schemas the code cannot be generated for
+        """
+
+        self.engine = engine
+        self.verify_rate = verify_rate
+
+        self._validators = {}
+        self._lock = threading.Lock()
+
+    def get(self, schema_tag, schema, content_hash=None, store=None):
+        """
+        Returns the compiled validator of a schema, the schema is checked only once
+
+        The content hash of the schema is computed when it is not given. With a
+        store of referenced schemas keyed by $id, references are resolved from
+        the store while validating. Raises a jsonschema SchemaError when the
+        schema itself is not valid
+        """
+
+        key = (schema_tag, content_hash or schema_hash(schema, store))
+
+        with self._lock:
+            entry = self._validators.get(key)
+
+            if entry is None:
+                entry = self._compile(schema_tag, schema, store)
+                self._validators[key] = entry
+
+        validator, schema_error = entry
+        if schema_error:
+            raise schema_error
+
+        return validator
+
+    def _compile(self, schema_tag, schema, store=None):
+        """
+        Checks a schema and builds a validator instance for it
+        """
+
+        validator_class = jsonschema.validators.validator_for(schema)
+
+        try:
+            validator_class.check_schema(schema)
+        except jsonschema.exceptions.SchemaError as e:
+            logging.error(
+                f"Schema '{schema_tag}' is not conform its meta-schema: {e.message}"
+            )
+            return None, e
+
+        if store is None:
+            validator = validator_class(schema)
+        else:
+            validator = validator_class(
+                schema, resolver=schema_registry.create_resolver(schema, store)
+            )
+
+        if self.engine == "codegen":
+            is_valid = fast_validator.compile_validator(validator, schema_tag)
+            if is_valid is not None:
+                validator = fast_validator.FastValidator(
+                    validator, is_valid, self.verify_rate
+                )
+
+        return validator, None
+
+
+def schema_hash(schema, store=None):
+    """
+    Returns a stable content hash of a schema and the schemas it references
+    """
+
+    content = schema if store is None else [schema, store]
+
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    ).hexdigest()
@@ -0,0 +1,155 @@
+import zlib
+from collections import namedtuple
+
+HEADER_MAGIC = b"\xfd7zXZ\x00"
+FOOTER_MAGIC = b"YZ"
+HEADER_SIZE = 12
+FOOTER_SIZE = 12
+TAIL_SIZE = 65536
+MAX_SINGLE_INDEX_SIZE = 24  # Bytes of the index of a file with one block
+
+XZBlock = namedtuple(
+    "XZBlock",
+    [
+        "compressed_offset",
+        "compressed_size",
+        "unpadded_size",
+        "uncompressed_offset",
+        "uncompressed_size",
+    ],
+)
+
+
+def read_blocks(read_range, size):
+    """
+    Reads the index of a single-stream XZ file
+
+    read_range is a function returning the bytes between two offsets, both
+    inclusive. Returns the stream flags and the blocks of the file, or None when
+    the file is not a single XZ stream with a valid index
+    """
+
+    if size < HEADER_SIZE + FOOTER_SIZE:
+        return None
+
+    tail = read_range(max(0, size - TAIL_SIZE), size - 1)
+    footer = tail[-FOOTER_SIZE:]
+
+    if footer[-2:] != FOOTER_MAGIC or zlib.crc32(footer[4:10]) != int.from_bytes(
+        footer[:4], "little"
+    ):
+        return None
+
+    stream_flags = footer[8:10]
+    backward_size = (int.from_bytes(footer[4:8], "little") + 1) * 4
+    index_offset = size - FOOTER_SIZE - backward_size
+
+    if index_offset < HEADER_SIZE:
+        return None
+
+    if backward_size + FOOTER_SIZE > len(tail):
+        tail = read_range(index_offset, size - 1)
+
+    index = tail[-FOOTER_SIZE - backward_size : -FOOTER_SIZE]
+    if index[0] != 0 or zlib.crc32(index[:-4]) != int.from_bytes(index[-4:], "little"):
+        return None
+
+    number_of_records, pos = read_varint(index, 1)
+
+    blocks = []
+    compressed_offset = HEADER_SIZE
+    uncompressed_offset = 0
+    for _ in range(number_of_records):
+        unpadded_size, pos = read_varint(index, pos)
+        uncompressed_size, pos = read_varint(index, pos)
+        compressed_size = (unpadded_size + 3) & ~3
+
+        blocks.append(
+            XZBlock(
+                compressed_offset,
+                compressed_size,
+                unpadded_size,
+                uncompressed_offset,
+                uncompressed_size,
+            )
+        )
+        compressed_offset += compressed_size
+        uncompressed_offset += uncompressed_size
+
+    # Files with more than one stream are not supported
+    if compressed_offset != index_offset:
+        return None
+
+    return stream_flags, blocks
+
+
+def has_more_blocks(head, size):
+    """
+    Tells from the first bytes of an XZ file whether it holds more than one block
+
+    The first block header must hold the compressed size of the block, as xz
+    writes it when it compresses with more than one thread. A file of which
+    this cannot be told is taken to hold one block
+    """
+
+    if len(head) < HEADER_SIZE + 1 or head[:6] != HEADER_MAGIC:
+        return False
+
+    header_size = (head[HEADER_SIZE] + 1) * 4
+    if head[HEADER_SIZE] == 0 or len(head) < HEADER_SIZE + header_size:
+        return False
+
+    if not head[HEADER_SIZE + 1] & 0x40:
+        return False
+
+    compressed_size, _ = read_varint(head, HEADER_SIZE + 2)
+    unpadded_size = header_size + compressed_size + check_size(head[7] & 0x0F)
+    block_end = HEADER_SIZE + ((unpadded_size + 3) & ~3)
+
+    return size - block_end - FOOTER_SIZE > MAX_SINGLE_INDEX_SIZE
+
+
+def check_size(check_type):
+    """
+    Returns the size of the check that follows every block of a stream
+    """
+
+    return 0 if check_type == 0 else 4 << ((check_type - 1) // 3)
+
+
+def stream_header(stream_flags):
+    """
+    Returns an XZ stream header for the given stream flags
+    """
+
+    return HEADER_MAGIC + stream_flags + zlib.crc32(stream_flags).to_bytes(4, "little")
+
+
+def find_block(blocks, uncompressed_offset):
+    """
+    Returns the block that holds an uncompressed offset
+    """
+
+    found = blocks[0]
+    for block in blocks:
+        if block.uncompressed_offset > uncompressed_offset:
+            break
+        found = block
+
+    return found
+
+
+def read_varint(data, pos):
+    """
+    Reads an XZ multibyte integer, returns its value and the position after it
+    """
+
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80 == 0:
+            return value, pos
+        shift += 7
@@ -4,6 +4,7 @@ import logging
 import sys
 from google.cloud import storage
 import json
+import topic_index
 
 
 class DatacatalogProcessor(object):
@@ -44,7 +45,9 @@ class DatacatalogProcessor(object):
                 content_type='application/json'
             )
             logging.info('Uploaded data catalog {} to bucket {}'.format(data_catalog_id, bucket_name))
-            return True
+            # Keep the topics of the data catalog in the topic index of the bucket
+            return topic_index.update_topic_index(
+                bucket, data_catalog_id, topic_index.catalog_topics(data_catalog))
         except Exception as e:
             logging.exception('Unable to upload data catalog ' +
                               'to storage because of {}'.format(e))
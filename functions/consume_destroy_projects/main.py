@@ -3,6 +3,7 @@ import json
 import base64
 import os
 from google.cloud import storage
+import topic_index
 
 
 logging.basicConfig(level=logging.INFO)
@@ -28,6 +29,7 @@ def process_destroy_projects(msg):
                 blob.delete()
             else:
                 logging.debug(f'Data catalog for {project_id} was already deleted')
+            topic_index.update_topic_index(bucket, project_id)
     else:
         logging.info('No projects specified to destroy in received message')
 
@@ -4,6 +4,11 @@ import logging
 import sys
 from google.cloud import storage
 import json
+from fill_refs_schema import fill_refs
+
+BUNDLE_PREFIX = '_bundled/'
+# Empty objects that keep the dependencies of schemas that could not be bundled
+PENDING_PREFIX = '_pending_bundles/'
 
 
 class SchemaProcessor(object):
@@ -46,12 +51,99 @@ class SchemaProcessor(object):
                 content_type='application/json'
             )
             logging.info('Uploaded schema {} to bucket {}'.format(schema_id, bucket_name))
+            # Store the schema with its references filled in for the validators
+            self.update_bundles(bucket, self.schema_name_from_tag(schema_id), schema)
             return True
         except Exception as e:
             logging.exception('Unable to upload schema ' +
                               'to storage because of {}'.format(e))
         return False
 
+    def update_bundles(self, bucket, blob_name, schema):
+        # Bundle the schema itself
+        self.upload_bundle(bucket, blob_name, schema)
+        # Rebuild the bundles of the schemas that reference this schema, also of
+        # the schemas that could not be bundled before because it was missing
+        for prefix in [BUNDLE_PREFIX, PENDING_PREFIX]:
+            for bundle_blob in bucket.list_blobs(prefix=prefix):
+                source_name = bundle_blob.name[len(prefix):]
+                dependencies = json.loads((bundle_blob.metadata or {}).get('dependencies', '{}'))
+                if source_name == blob_name or blob_name not in dependencies:
+                    continue
+                source_blob = bucket.get_blob(source_name)
+                if source_blob is None:
+                    logging.info('Schema {} of bundle {} is not in storage, deleting'.format(
+                        source_name, bundle_blob.name))
+                    bundle_blob.delete()
+                    continue
+                logging.info('Schema {} references schema {}, rebuilding its bundle'.format(source_name, blob_name))
+                self.upload_bundle(bucket, source_name, json.loads(source_blob.download_as_string()))
+
+    def upload_bundle(self, bucket, blob_name, schema):
+        bundle_blob = bucket.blob(BUNDLE_PREFIX + blob_name)
+        pending_blob = bucket.blob(PENDING_PREFIX + blob_name)
+        dependencies = None
+        try:
+            dependencies = self.get_dependencies(bucket, schema)
+            bundled_schema = fill_refs(schema)
+        except Exception as e:
+            logging.error('Unable to bundle schema {} because of {}'.format(blob_name, e))
+            # Remove an outdated bundle, validators then fill the references themselves
+            if bundle_blob.exists():
+                bundle_blob.delete()
+            if dependencies is not None:
+                # Keep the dependencies, so the schema is bundled when a missing one is stored
+                pending_blob.metadata = {'dependencies': json.dumps(dependencies)}
+                pending_blob.upload_from_string(data='', content_type='application/json')
+            return False
+        bundle_blob.metadata = {'dependencies': json.dumps(dependencies)}
+        bundle_blob.upload_from_string(
+            data=json.dumps(bundled_schema),
+            content_type='application/json'
+        )
+        if pending_blob.exists():
+            pending_blob.delete()
+        logging.info('Uploaded bundle of schema {} with {} dependencies'.format(blob_name, len(dependencies)))
+        return True
+
+    def get_dependencies(self, bucket, schema):
+        # Returns the generations of all schemas that are referenced by a schema,
+        # directly or through other schemas
+        dependencies = {}
+        schemas_to_check = [schema]
+        while schemas_to_check:
+            for ref in find_refs(schemas_to_check.pop()):
+                uri = ref.split('#')[0]
+                if 'tag' not in uri and 'http' not in uri:
+                    continue
+                dependency_name = self.schema_name_from_tag(uri)
+                if not dependency_name.endswith('.json'):
+                    dependency_name = dependency_name + '.json'
+                if dependency_name in dependencies:
+                    continue
+                dependency_blob = bucket.get_blob(dependency_name)
+                if dependency_blob is None:
+                    dependencies[dependency_name] = None
+                else:
+                    dependencies[dependency_name] = dependency_blob.generation
+                    schemas_to_check.append(json.loads(dependency_blob.download_as_string()))
+        return dependencies
+
     def schema_name_from_tag(self, schema_name):
         schema_name = schema_name.replace('/', '_')
         return schema_name
+
+
+def find_refs(schema):
+    # Returns all references in a schema
+    refs = []
+    nodes = [schema]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, dict):
+            if isinstance(node.get('$ref'), str):
+                refs.append(node['$ref'])
+            nodes.extend(node.values())
+        elif isinstance(node, list):
+            nodes.extend(node)
+    return refs
@@ -1,167 +1,216 @@
 #!/usr/bin/python3
 
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
 import operator
-from io import StringIO
 import json
-import sys
-from google.cloud import storage
+import threading
+from urllib.parse import quote
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
+from google.resumable_media import InvalidResponse
+from google.resumable_media.requests import Download
 import os
 
-storage_client_external = storage.Client()
 schemas_bucket = os.environ.get('SCHEMAS_BUCKET_NAME', 'Required parameter is missing')
-storage_bucket = storage_client_external.get_bucket(schemas_bucket)
-
-
-def fill_refs(schema):
-    schema_json = schema
-    new_schema = StringIO()
-    schema = json.dumps(schema, indent=2)
-    # Make schema into list so that every newline can be printed
-    schema_list = schema.split('\n')
-    for line in schema_list:
-        if '$ref' in line:
-            # If a '#' is in the reference, it's a reference to a definition
-            if '#' in line:
-                if '"$ref": "' in line:
-                    line_array_def = line.split('"$ref": "')
-                elif '"$ref" : "' in line:
-                    line_array_def = line.split('"$ref" : "')
-                else:
-                    line_array_def = ''
-                ref_def = line_array_def[1].replace('\"', '')
-                # If the reference is only '#'
-                if ref_def == '#':
-                    # Just write it to the stringio file
-                    new_schema.write(line)
-                else:
-                    # Check if there is a URI in front of the '#'
-                    # Because then the definition is in another schema
-                    comma_at_end = False
-                    if 'tag' in ref_def or 'http' in ref_def:
-                        # Split on the '#/'
-                        ref_def_array = ref_def.split("#/")
-                        uri_part = ref_def_array[0]
-                        def_part = ref_def_array[1]
-                        if def_part[-1] == ',':
-                            def_part = def_part[:-1]
-                            comma_at_end = True
-                        # Get file from GCP storage
-                        reference_schema_def = get_schema_from_stg(uri_part)
-                    else:
-                        # Reference to definition is in this schema
-                        # Split on the '#/'
-                        ref_def_array = ref_def.split("#/")
-                        def_part = ref_def_array[1]
-                        # If there's a comma at the end
-                        if def_part[-1] == ',':
-                            def_part = def_part[:-1]
-                            comma_at_end = True
-                        reference_schema_def = schema_json
-                    # Now find key in json where the reference is defined
-                    def_part_array = def_part.split('/')
-                    def_from_dict = getFromDict(reference_schema_def, def_part_array)
-                    # If type of definition reference is dict
-                    if type(def_from_dict) is dict:
-                        # put reference in stringio file
-                        def_from_dict_txt = json.dumps(def_from_dict, indent=2)
-                        def_from_dict_list = def_from_dict_txt.split('\n')
-                        for i in range(len(def_from_dict_list)):
-                            # Do not add the beginning '{' and '}'
-                            if i != 0 and i != (len(def_from_dict_list)-1):
-                                line_to_write = def_from_dict_list[i]
-                                # Write the reference schema to the stringio file
-                                if i == len(def_from_dict_list)-2 and comma_at_end:
-                                    line_to_write = "{},".format(line_to_write)
-                                new_schema.write(line_to_write)
-                    else:
-                        print("Definition should be dict")
-            # If reference is a URL
-            elif 'http' in line:
-                if '"$ref": "' in line:
-                    line_array = line.split('"$ref": "')
-                elif '"$ref" : "' in line:
-                    line_array = line.split('"$ref" : "')
-                else:
-                    line_array = ''
-                ref = line_array[1].replace('\"', '')
-                # Fill reference
-                new_schema = fill_from_local_schema(new_schema, ref)
-            # If reference is a tag
-            elif 'tag' in line:
-                if '"$ref": "' in line:
-                    line_array = line.split('"$ref": "')
-                elif '"$ref" : "' in line:
-                    line_array = line.split('"$ref" : "')
+
+MAX_FETCH_WORKERS = 8
+DOWNLOAD_URL = 'https://storage.googleapis.com/download/storage/v1/b/{}/o/{}?alt=media'
+SCOPES = ['https://www.googleapis.com/auth/devstorage.read_only']
+
+# Schemas fetched by this process, keyed by blob name with their generation
+schema_cache = {}
+# Authorized session of this process for callers that do not pass their own
+default_session = {}
+default_session_lock = threading.Lock()
+
+
+def get_default_session():
+    # The session is created on first use, so importing this module makes no requests
+    with default_session_lock:
+        if 'session' not in default_session:
+            credentials, _ = google.auth.default(scopes=SCOPES)
+            default_session['session'] = AuthorizedSession(credentials)
+        return default_session['session']
+
+
+def fill_refs(schema, session=None):
+    # First fetch all schemas that are referenced, then fill them in
+    return GCPRefResolver(prefetch_schemas(schema, session), session).fill(schema)
+
+
+def prefetch_schemas(schema, session=None):
+    # Fetches the schemas that are referenced by a schema, directly or through
+    # other schemas, with one concurrent round of downloads per level
+    schemas = {}
+    blob_names = sorted(ref_blob_names(schema))
+    while blob_names:
+        with ThreadPoolExecutor(max_workers=min(MAX_FETCH_WORKERS, len(blob_names))) as executor:
+            fetched_schemas = dict(zip(
+                blob_names, executor.map(lambda blob_name: fetch_schema(blob_name, session), blob_names)))
+        schemas.update(fetched_schemas)
+        blob_names = sorted({
+            blob_name
+            for fetched_schema in fetched_schemas.values() if fetched_schema is not None
+            for blob_name in ref_blob_names(fetched_schema)
+        } - set(schemas))
+    return schemas
+
+
+def ref_blob_names(schema):
+    # Returns the blob names of the schemas referenced in a schema
+    blob_names = set()
+    nodes = [schema]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, dict):
+            ref = node.get('$ref')
+            if isinstance(ref, str):
+                uri_part = ref.split('#')[0]
+                if 'tag' in uri_part or 'http' in uri_part:
+                    blob_names.add(schema_name_from_tag(uri_part))
+            nodes.extend(node.values())
+        elif isinstance(node, list):
+            nodes.extend(node)
+    return blob_names
+
+
+def fetch_schema(blob_name, session=None):
+    # Downloads a schema in a single request with an authorized session, a schema
+    # that is cached is only downloaded again when its generation changed.
+    # Returns None if it is missing
+    cached = schema_cache.get(blob_name)
+    url = DOWNLOAD_URL.format(quote(schemas_bucket, safe=''), quote(blob_name, safe=''))
+    if cached:
+        url = url + '&ifGenerationNotMatch={}'.format(cached[0])
+    try:
+        response = Download(url).consume(session or get_default_session())
+    except InvalidResponse as e:
+        if e.response.status_code == 304:
+            return cached[1]
+        if e.response.status_code == 404:
+            schema_cache.pop(blob_name, None)
+            return None
+        raise
+    schema = json.loads(response.content)
+    schema_cache[blob_name] = (int(response.headers['X-Goog-Generation']), schema)
+    return schema
+
+
+class GCPRefResolver(object):
+    # Fills in references by walking the schema, the members of a referenced
+    # schema or definition replace the '$ref' in the object that holds it.
+    # Referenced schemas come from the prefetched schemas, every reference is
+    # resolved once and resolved parts are shared between the places that use it
+    def __init__(self, schemas, session=None):
+        self.schemas = schemas
+        self.session = session
+        self.filled_schemas = {}
+        self.definitions = {}
+        self.filling = []
+        self.schemas_filled = 0
+
+    def fill(self, schema, schema_name=None):
+        if schema_name is None:
+            # Definitions of the schema that is filled are memoised per schema
+            self.schemas_filled += 1
+            schema_name = ('schema', self.schemas_filled)
+        return self.fill_node(schema, schema, schema_name)
+
+    def fill_node(self, node, root, root_name):
+        if isinstance(node, list):
+            return [self.fill_node(item, root, root_name) for item in node]
+        if not isinstance(node, dict):
+            return node
+        new_node = {}
+        for key, value in node.items():
+            if key == '$ref' and isinstance(value, str):
+                members = self.resolve(value, root, root_name)
+                if members is None:
+                    # Keep references that are not filled in
+                    new_node[key] = value
                 else:
-                    line_array = ''
-                ref = line_array[1].replace('\"', '')
-                # Fill reference
-                new_schema = fill_from_local_schema(new_schema, ref)
+                    # Later keys win, like duplicate keys in JSON
+                    for member_key, member_value in members.items():
+                        new_node[member_key] = member_value
             else:
-                # If the line does not contain any tag references
-                # Just write it to the stringio file
-                new_schema.write(line)
-        else:
-            # If the line does not contain any references
-            # Just write it to the stringio file
-            new_schema.write(line)
-    contents = new_schema.getvalue()
-    new_schema = json.loads(contents)
-    return new_schema
-
-
-def fill_from_local_schema(new_schema, meta_data_uri):
-    # Get schema from GCP
-    reference_schema = get_schema_from_stg(meta_data_uri)
-    try:
-        # Also fill in references if they occur in the reference schema
-        reference_schema = fill_refs(reference_schema)
-    except Exception as e:
-        if '$id' in reference_schema:
-            print("The references in schema {} ".format(reference_schema['$id']) +
-                  "could not be filled because of {}".format(e))
-        else:
-            print("The references in a schema " +
-                  "could not be filled because of {}".format(e))
-        sys.exit(1)
-    else:
+                new_node[key] = self.fill_node(value, root, root_name)
+        return new_node
+
+    def resolve(self, ref, root, root_name):
+        # If a '#' is in the reference, it's a reference to a definition
+        if '#' in ref:
+            # If the reference is only '#'
+            if ref == '#':
+                return None
+            uri_part, def_part = ref.split('#/', 1)
+            # Check if there is a URI in front of the '#'
+            # Because then the definition is in another schema
+            if 'tag' in uri_part or 'http' in uri_part:
+                definition_name = schema_name_from_tag(uri_part)
+                reference_schema_def = self.get_schema(definition_name)
+            else:
+                # Reference to definition is in this schema
+                definition_name = root_name
+                reference_schema_def = root
+            key = (definition_name, def_part)
+            if key not in self.definitions:
+                # Now find key in json where the reference is defined
+                self.definitions[key] = getFromDict(reference_schema_def, def_part.split('/'))
+            def_from_dict = self.definitions[key]
+            # If type of definition reference is dict
+            if type(def_from_dict) is dict:
+                return def_from_dict
+            print("Definition should be dict")
+            return {}
+        # If reference is a URL or a tag
+        if 'http' in ref or 'tag' in ref:
+            return self.fill_from_stg_schema(ref)
+        return None
+
+    def fill_from_stg_schema(self, meta_data_uri):
+        blob_name = schema_name_from_tag(meta_data_uri)
+        if blob_name in self.filled_schemas:
+            return self.filled_schemas[blob_name]
+        if blob_name in self.filling:
+            cycle = self.filling[self.filling.index(blob_name):] + [blob_name]
+            raise ValueError("Reference {} is circular: {}".format(meta_data_uri, ' -> '.join(cycle)))
+        reference_schema = self.get_schema(blob_name)
+        if reference_schema is None:
+            raise ValueError("Reference schema of reference {} could not be found".format(meta_data_uri))
+        self.filling.append(blob_name)
+        try:
+            # Also fill in references if they occur in the reference schema
+            reference_schema = self.fill(reference_schema, blob_name)
+        # Errors are raised instead of exiting, so a function that fills in
+        # references can handle them and go on with other schemas
+        except Exception as e:
+            if '$id' in reference_schema:
+                raise ValueError("The references in schema {} ".format(reference_schema['$id']) +
+                                 "could not be filled because of {}".format(e)) from e
+            raise ValueError("The references in a schema " +
+                             "could not be filled because of {}".format(e)) from e
+        finally:
+            self.filling.pop()
         # Double check if the uri of the schema is the same as the
         # one of the reference
-        if '$id' in reference_schema:
-            if reference_schema['$id'] == meta_data_uri:
-                # Add the schema to the new schema
-                reference_schema_txt = json.dumps(reference_schema, indent=2)
-                reference_schema_list = reference_schema_txt.split('\n')
-                for i in range(len(reference_schema_list)):
-                    # Do not add the beginning '{' and '}'
-                    if i != 0 and i != (len(reference_schema_list)-1):
-                        # Write the reference schema to the stringio file
-                        new_schema.write(reference_schema_list[i])
-            else:
-                print("ID of reference is {} while ".format(meta_data_uri) +
-                      "that of the schema is {}".format(reference_schema['$id']))
-                sys.exit(1)
-        else:
-            print("Reference schema of reference {} has no ID".format(meta_data_uri))
-            sys.exit(1)
-    return new_schema
-
-
-def get_schema_from_stg(tag):
-    # Get schemas bucket from other project
-    blob_name = schema_name_from_tag(tag)
-    # Check if schema is in schema storage
-    if storage.Blob(bucket=storage_bucket, name=blob_name).exists(storage_client_external):
-        # Get blob
-        blob = storage_bucket.get_blob(blob_name)
-        # Convert to string
-        blob_json_string = blob.download_as_string()
-        # Convert to json
-        blob_json = json.loads(blob_json_string)
-        # return blob in json format
-        return blob_json
-    return None
+        if '$id' not in reference_schema:
+            raise ValueError("Reference schema of reference {} has no ID".format(meta_data_uri))
+        if reference_schema['$id'] != meta_data_uri:
+            raise ValueError("ID of reference is {} while ".format(meta_data_uri) +
+                             "that of the schema is {}".format(reference_schema['$id']))
+        self.filled_schemas[blob_name] = reference_schema
+        return reference_schema
+
+    def get_schema(self, blob_name):
+        # Schemas that were not prefetched are fetched when they are needed
+        if blob_name not in self.schemas:
+            self.schemas[blob_name] = fetch_schema(blob_name, self.session)
+        return self.schemas[blob_name]
+
+
+def get_schema_from_stg(tag, session=None):
+    return fetch_schema(schema_name_from_tag(tag), session)
 
 
 def schema_name_from_tag(tag):
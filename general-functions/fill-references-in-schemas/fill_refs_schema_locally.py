@@ -2,176 +2,162 @@
 
 from functools import reduce
 import operator
-from io import StringIO
 import json
 import sys
 
 
 def fill_refs(schema, schema_folder_path):
-    schema_json = schema
-    new_schema = StringIO()
-    schema = json.dumps(schema, indent=2)
-    # Make schema into list so that every newline can be printed
-    schema_list = schema.split('\n')
-    for line in schema_list:
-        if '$ref' in line:
-            # If a '#' is in the reference, it's a reference to a definition
-            if '#' in line:
-                if '"$ref": "' in line:
-                    line_array_def = line.split('"$ref": "')
-                elif '"$ref" : "' in line:
-                    line_array_def = line.split('"$ref" : "')
-                else:
-                    line_array_def = ''
-                ref_def = line_array_def[1].replace('\"', '')
-                # If the reference is only '#'
-                if ref_def == '#':
-                    # Just write it to the stringio file
-                    new_schema.write(line)
-                else:
-                    # Check if there is a URI in front of the '#'
-                    # Because then the definition is in another schema
-                    comma_at_end = False
-                    if 'tag' in ref_def or 'http' in ref_def:
-                        # Split on the '#/'
-                        ref_def_array = ref_def.split("#/")
-                        uri_part = ref_def_array[0]
-                        def_part = ref_def_array[1]
-                        if def_part[-1] == ',':
-                            def_part = def_part[:-1]
-                            comma_at_end = True
-                        # Get filename
-                        if 'http' in uri_part:
-                            # Find schema via its URL locally
-                            schema_file_name = uri_part.replace("://", "_")
-                        elif 'tag' in uri_part:
-                            # Find schema via its tag locally
-                            schema_file_name = uri_part.replace("tag:", "tag_")
-                            schema_file_name = uri_part.replace(":", "_")
-                        else:
-                            print("Reference is not a http(s) or tag as uri")
-                            sys.exit(1)
-                        schema_file_name = schema_file_name.replace('/', '_')
-                        if (not schema_file_name.endswith('.json')):
-                            schema_file_name = schema_file_name + '.json'
-                        ref_def_schema_path = schema_folder_path + "/" + schema_file_name.replace(',', '')
-                        try:
-                            with open(ref_def_schema_path, 'r') as f:
-                                reference_schema_def = json.load(f)
-                        except Exception as e:
-                            print("Schema of reference to definition cannot be openend " +
-                                  "because of {}".format(e))
-                    else:
-                        # Reference to definition is in this schema
-                        # Split on the '#/'
-                        ref_def_array = ref_def.split("#/")
-                        def_part = ref_def_array[1]
-                        # If there's a comma at the end
-                        if def_part[-1] == ',':
-                            def_part = def_part[:-1]
-                            comma_at_end = True
-                        reference_schema_def = schema_json
-                    # Now find key in json where the reference is defined
-                    def_part_array = def_part.split('/')
-                    def_from_dict = getFromDict(reference_schema_def, def_part_array)
-                    # If type of definition reference is dict
-                    if type(def_from_dict) is dict:
-                        # put reference in stringio file
-                        def_from_dict_txt = json.dumps(def_from_dict, indent=2)
-                        def_from_dict_list = def_from_dict_txt.split('\n')
-                        for i in range(len(def_from_dict_list)):
-                            # Do not add the beginning '{' and '}'
-                            if i != 0 and i != (len(def_from_dict_list)-1):
-                                line_to_write = def_from_dict_list[i]
-                                # Write the reference schema to the stringio file
-                                if i == len(def_from_dict_list)-2 and comma_at_end:
-                                    line_to_write = "{},".format(line_to_write)
-                                new_schema.write(line_to_write)
-                    else:
-                        print("Definition should be dict")
-            # If reference is a URL
-            elif 'http' in line:
-                if '"$ref": "' in line:
-                    line_array = line.split('"$ref": "')
-                elif '"$ref" : "' in line:
-                    line_array = line.split('"$ref" : "')
+    return LocalRefResolver(schema_folder_path).fill(schema)
+
+
+class LocalRefResolver(object):
+    # Fills in references by walking the schema, the members of a referenced
+    # schema or definition replace the '$ref' in the object that holds it.
+    # Every file is read once and every reference is resolved once, resolved
+    # parts are shared between the places that reference them
+    def __init__(self, schema_folder_path):
+        self.schema_folder_path = schema_folder_path
+        self.files = {}
+        self.filled_schemas = {}
+        self.definitions = {}
+        self.filling = []
+        self.schemas_filled = 0
+
+    def fill(self, schema, schema_path=None):
+        if schema_path is None:
+            # Definitions of schemas without a file are memoised per schema
+            self.schemas_filled += 1
+            schema_path = ('schema', self.schemas_filled)
+        return self.fill_node(schema, schema, schema_path)
+
+    def fill_node(self, node, root, root_path):
+        if isinstance(node, list):
+            return [self.fill_node(item, root, root_path) for item in node]
+        if not isinstance(node, dict):
+            return node
+        new_node = {}
+        for key, value in node.items():
+            if key == '$ref' and isinstance(value, str):
+                members = self.resolve(value, root, root_path)
+                if members is None:
+                    # Keep references that are not filled in
+                    new_node[key] = value
                 else:
-                    line_array = ''
-                ref = line_array[1].replace('\"', '')
+                    # Later keys win, like duplicate keys in JSON
+                    for member_key, member_value in members.items():
+                        new_node[member_key] = member_value
+            else:
+                new_node[key] = self.fill_node(value, root, root_path)
+        return new_node
+
+    def resolve(self, ref, root, root_path):
+        # If a '#' is in the reference, it's a reference to a definition
+        if '#' in ref:
+            # If the reference is only '#'
+            if ref == '#':
+                return None
+            uri_part, def_part = ref.split('#/', 1)
+            # Check if there is a URI in front of the '#'
+            # Because then the definition is in another schema
+            definition_path = self.ref_file_path(ref)
+            if definition_path is not None:
+                try:
+                    reference_schema_def = self.load(definition_path)
+                except Exception as e:
+                    print('Schema of reference to definition cannot be openend ' +
+                          'because of {}'.format(e))
+                    raise
+            else:
+                # Reference to definition is in this schema
+                definition_path = root_path
+                reference_schema_def = root
+            key = (definition_path, def_part)
+            if key not in self.definitions:
+                # Now find key in json where the reference is defined
+                self.definitions[key] = getFromDict(reference_schema_def, def_part.split('/'))
+            def_from_dict = self.definitions[key]
+            # If type of definition reference is dict
+            if type(def_from_dict) is dict:
+                return def_from_dict
+            print('Definition should be dict')
+            return {}
+        ref_schema_path = self.ref_file_path(ref)
+        if ref_schema_path is not None:
+            return self.fill_from_local_schema(ref, ref_schema_path)
+        return None
+
+    def ref_file_path(self, ref):
+        # Returns the path of the schema file a reference points to, or None
+        # when the reference is to this schema itself
+        if '#' in ref:
+            uri_part = ref.split('#', 1)[0]
+            if 'tag' not in uri_part and 'http' not in uri_part:
+                return None
+            if 'http' in uri_part:
                 # Find schema via its URL locally
-                meta_data_file_name = ref.replace("://", "_")
-                # If file does not have .json as extension
-                if(not meta_data_file_name.endswith('.json')):
-                    meta_data_file_name = meta_data_file_name + ".json"
-                # Fill reference
-                new_schema = fill_from_local_schema(new_schema, schema_folder_path, ref, meta_data_file_name)
-            # If reference is a tag
-            elif 'tag' in line:
-                if '"$ref": "' in line:
-                    line_array = line.split('"$ref": "')
-                elif '"$ref" : "' in line:
-                    line_array = line.split('"$ref" : "')
-                else:
-                    line_array = ''
-                ref = line_array[1].replace('\"', '')
-                # Find schema via its tag locally
-                meta_data_file_name = ref.replace("tag:", "tag_")
-                meta_data_file_name = ref.replace(":", "_")
-                # Fill reference
-                new_schema = fill_from_local_schema(new_schema, schema_folder_path, ref, meta_data_file_name)
+                schema_file_name = uri_part.replace('://', '_')
             else:
-                # If the line does not contain any tag references
-                # Just write it to the stringio file
-                new_schema.write(line)
+                # Find schema via its tag locally
+                schema_file_name = uri_part.replace(':', '_')
+            schema_file_name = schema_file_name.replace('/', '_')
+            if not schema_file_name.endswith('.json'):
+                schema_file_name = schema_file_name + '.json'
+            return self.schema_folder_path + '/' + schema_file_name
+        # If reference is a URL
+        if 'http' in ref:
+            # Find schema via its URL locally
+            meta_data_file_name = ref.replace('://', '_')
+            # If file does not have .json as extension
+            if not meta_data_file_name.endswith('.json'):
+                meta_data_file_name = meta_data_file_name + '.json'
+        # If reference is a tag
+        elif 'tag' in ref:
+            # Find schema via its tag locally
+            meta_data_file_name = ref.replace(':', '_')
         else:
-            # If the line does not contain any references
-            # Just write it to the stringio file
-            new_schema.write(line)
-    contents = new_schema.getvalue()
-    new_schema = json.loads(contents)
-    return new_schema
-
+            return None
+        return self.schema_folder_path + '/' + meta_data_file_name.replace('/', '_')
 
-def fill_from_local_schema(new_schema, schema_folder_path, meta_data_uri, meta_data_file_name):
-    # Replace /
-    meta_data_file_name = meta_data_file_name.replace("/", "_")
-    # Path to schema
-    ref_schema_path = schema_folder_path + "/" + meta_data_file_name
-    # Check if the path to the schema exists in the schemas folder
-    try:
-        with open(ref_schema_path, 'r') as f:
-            reference_schema = json.load(f)
-    except Exception as e:
-        print("The schema reference in path {} could not be opened because of {}".format(ref_schema_path, e))
-        sys.exit(1)
-    try:
-        # Also fill in references if they occur in the reference schema
-        reference_schema = fill_refs(reference_schema, schema_folder_path)
-    except Exception as e:
-        print("The references in schema with path {} ".format(ref_schema_path) +
-              "could not be filled because of {}".format(e))
-        sys.exit(1)
-    else:
+    def fill_from_local_schema(self, meta_data_uri, ref_schema_path):
+        if ref_schema_path in self.filled_schemas:
+            return self.filled_schemas[ref_schema_path]
+        if ref_schema_path in self.filling:
+            cycle = self.filling[self.filling.index(ref_schema_path):] + [ref_schema_path]
+            print('The schema reference {} is circular: {}'.format(meta_data_uri, ' -> '.join(cycle)))
+            sys.exit(1)
+        # Check if the path to the schema exists in the schemas folder
+        try:
+            reference_schema = self.load(ref_schema_path)
+        except Exception as e:
+            print('The schema reference in path {} could not be opened because of {}'.format(ref_schema_path, e))
+            sys.exit(1)
+        self.filling.append(ref_schema_path)
+        try:
+            # Also fill in references if they occur in the reference schema
+            reference_schema = self.fill(reference_schema, ref_schema_path)
+        except Exception as e:
+            print('The references in schema with path {} '.format(ref_schema_path) +
+                  'could not be filled because of {}'.format(e))
+            sys.exit(1)
+        finally:
+            self.filling.pop()
         # Double check if the uri of the schema is the same as the
         # one of the reference
-        if '$id' in reference_schema:
-            if reference_schema['$id'] == meta_data_uri:
-                # Add the schema to the new schema
-                reference_schema_txt = json.dumps(reference_schema, indent=2)
-                reference_schema_list = reference_schema_txt.split('\n')
-                for i in range(len(reference_schema_list)):
-                    # Do not add the beginning '{' and '}'
-                    if i != 0 and i != (len(reference_schema_list)-1):
-                        # Write the reference schema to the stringio file
-                        new_schema.write(reference_schema_list[i])
-            else:
-                print("ID of reference is {} while ".format(meta_data_uri) +
-                      "that of the schema is {}".format(reference_schema['$id']))
-                sys.exit(1)
-        else:
-            print("Reference schema of reference {} has no ID".format(meta_data_uri))
+        if '$id' not in reference_schema:
+            print('Reference schema of reference {} has no ID'.format(meta_data_uri))
             sys.exit(1)
-    return new_schema
+        if reference_schema['$id'] != meta_data_uri:
+            print('ID of reference is {} while '.format(meta_data_uri) +
+                  'that of the schema is {}'.format(reference_schema['$id']))
+            sys.exit(1)
+        self.filled_schemas[ref_schema_path] = reference_schema
+        return reference_schema
+
+    def load(self, path):
+        if path not in self.files:
+            with open(path, 'r') as f:
+                self.files[path] = json.load(f)
+        return self.files[path]
 
 
 # This function traverses the dictionary and gets the value of a key from a list of attributes
@@ -0,0 +1,151 @@
+import json
+import logging
+import time
+from datetime import datetime, timezone
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+INDEX_BLOB_NAME = '_index/topics.json'
+INDEX_PREFIX = '_index/'
+MAX_RETRIES = 10
+
+
+def catalog_topics(data_catalog, updated=None):
+    """
+    Returns the topics of a data catalog that have a schema, keyed by topic name
+    """
+
+    updated = updated or datetime.now(timezone.utc).isoformat()
+
+    topics = {}
+    for dataset in data_catalog.get('dataset', []):
+        for dist in dataset.get('distribution', []):
+            if dist.get('format') == 'topic' and 'describedBy' in dist and 'describedByType' in dist:
+                topic = {
+                    'schema_tag': dist['describedBy'],
+                    'project_id': data_catalog.get('projectId'),
+                    'updated': updated
+                }
+                if 'validationSampleRate' in dist:
+                    sample_rate = parse_sample_rate(dist['validationSampleRate'], dist.get('title', 'unknown'))
+                    if sample_rate is not None:
+                        topic['sample_rate'] = sample_rate
+                topics[dist.get('title', 'unknown')] = topic
+    return topics
+
+
+def parse_sample_rate(value, topic_name):
+    """
+    Returns the validation sample rate of a topic, or None when it is not a
+    number above 0 and at most 1
+    """
+
+    try:
+        sample_rate = float(value)
+    except (TypeError, ValueError):
+        sample_rate = None
+
+    # Also rejects NaN, for which every comparison is false
+    if sample_rate is None or not 0 < sample_rate <= 1:
+        logging.warning('Ignoring validationSampleRate {!r} of topic {}, it must be above 0 and at most 1'.format(
+            value, topic_name))
+        return None
+    return sample_rate
+
+
+def read_topic_index(bucket):
+    """
+    Returns the topics of the topic index in a data catalogs bucket, or None when
+    there is no index yet
+
+    A topic that is listed by several projects is returned as listed by the
+    project of which the data catalog was updated last
+    """
+
+    try:
+        index = json.loads(bucket.blob(INDEX_BLOB_NAME).download_as_string())
+    except NotFound:
+        return None
+
+    return {
+        topic_name: max(projects.values(), key=lambda topic: topic.get('updated') or '')
+        for topic_name, projects in topic_projects(index['topics']).items()
+    }
+
+
+def topic_projects(index_topics):
+    """
+    Returns the topics of an index with the topic as listed by every project that
+    lists it, keyed by project, also for an index that has one project per topic
+    """
+
+    return {
+        topic_name: topic['projects'] if 'projects' in topic else {topic.get('project_id'): topic}
+        for topic_name, topic in index_topics.items()
+    }
+
+
+def update_topic_index(bucket, project_id, topics=None):
+    """
+    Replaces the topics of a project in the topic index, removes them when no
+    topics are given
+
+    Every topic keeps the projects that list it, so a topic is only removed when
+    no project lists it anymore. The index is written with a generation
+    precondition and the update is retried when another function changed the
+    index in the meantime. When there is no index yet, it is built from all data
+    catalogs in the bucket first
+    """
+
+    for attempt in range(MAX_RETRIES):
+        blob = bucket.get_blob(INDEX_BLOB_NAME)
+
+        if blob is None:
+            generation = 0
+            projects_by_topic = build_topics(bucket)
+        else:
+            generation = blob.generation
+            projects_by_topic = topic_projects(json.loads(blob.download_as_string())['topics'])
+
+        for projects in projects_by_topic.values():
+            projects.pop(project_id, None)
+        for topic_name, topic in (topics or {}).items():
+            projects_by_topic.setdefault(topic_name, {})[project_id] = topic
+
+        index_topics = {
+            topic_name: {'projects': projects}
+            for topic_name, projects in projects_by_topic.items() if projects
+        }
+
+        try:
+            bucket.blob(INDEX_BLOB_NAME).upload_from_string(
+                data=json.dumps({'topics': index_topics}),
+                content_type='application/json',
+                if_generation_match=generation
+            )
+        except PreconditionFailed:
+            logging.info('Topic index was changed by another function, retrying')
+            time.sleep(0.1 * 2 ** attempt)
+        else:
+            logging.info('Updated topics of {} in the topic index'.format(project_id))
+            return True
+
+    logging.error('Could not update topics of {} in the topic index'.format(project_id))
+    return False
+
+
+def build_topics(bucket):
+    """
+    Returns the topics of all data catalogs in a bucket, with the topic as listed
+    by every data catalog keyed by its project
+    """
+
+    projects_by_topic = {}
+    for blob in bucket.list_blobs():
+        if blob.name.startswith(INDEX_PREFIX):
+            continue
+        updated = blob.updated.isoformat() if blob.updated else None
+        # Data catalogs are stored with their project as name
+        for topic_name, topic in catalog_topics(json.loads(blob.download_as_string()), updated=updated).items():
+            projects_by_topic.setdefault(topic_name, {})[blob.name] = topic
+    return projects_by_topic